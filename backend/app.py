@@ -1,46 +1,45 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, request, jsonify
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from flask_mail import Mail, Message
 import os
-import requests
 from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
+from sqlalchemy import func, insert, inspect, or_
 from datetime import datetime
-from models import db, User, Product, Category, Order
+from models import db, User, Product, Category, Order, ensure_indexes
+from pagination import PaginationError, parse_limit, parse_sort, keyset_order, keyset_page
+from search import apply_search, ensure_search_index
+from cache import cached, response_cache
+from conditional import conditional
+from mailer import mail_dispatcher
+from passwords import hash_password, verify_password, needs_rehash
+from inventory import InsufficientStock, reserve_stock, with_retries
+from images import save_upload, schedule_variants, original_for_variant
+from uploads import send_upload, cache_policy
+from streaming import STREAM_BATCH_SIZE, stream_csv, stream_json, wants_stream
+from serializers import FieldError, USER, USER_SESSION, CATEGORY, PRODUCT, ORDER
+from stats import record_order, record_status_change, ensure_seller_stats, seller_stats
+from database import database_url, engine_options, replica_binds, init_replica_routing
+from metrics import PROMETHEUS_CONTENT_TYPE, metrics, init_metrics, serialize_timer
+from ratelimit import init_rate_limits, stats as admission_stats
+from geo import NearError, parse_near, apply_near, distance_km, ensure_product_geo
+from events import (EVENTS_RETRY_MS, order_stream, open_stream, close_stream, publish_order_event,
+                    stats as event_stats)
+from facets import FACET_TOP_LOCATIONS, product_facets, record_category_order, ensure_category_stats
+from bulk import (ImportFormatError, EXPORT_COLUMNS, import_format, read_rows, import_products,
+                  export_query, export_row)
 
 load_dotenv()
 
-app = Flask(__name__)
-
-# Database configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "tarim_pazari.db")}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Upload configuration
 UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Mail configuration
-app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
-app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
-app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True') == 'True'
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@tarim-pazari.com')
-
-db.init_app(app)
-mail = Mail(app)
-
 # Allowed origins for CORS
 ALLOWED_ORIGINS = [
     'https://tarim-pazar.vercel.app',
@@ -49,11 +48,28 @@ ALLOWED_ORIGINS = [
     'http://localhost:3000'
 ]
 
-# CORS configuration - restricted to allowed origins
-CORS(app, origins=ALLOWED_ORIGINS, supports_credentials=True)
+# Environment variables
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 5000))
+# Reverse proxies in front of the app (Render, Heroku and Railway routers
+# count as one, and so does the Vercel /api rewrite in front of them); their
+# X-Forwarded-For is trusted for the client address the rate limits key on
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+RECAPTCHA_SECRET_KEY = os.getenv('RECAPTCHA_SECRET_KEY', '')
+
+# All endpoints live on this blueprint; create_app() registers it. cli_group
+# None puts its commands at the top level (`flask init-db`).
+api = Blueprint('api', __name__, cli_group=None)
+
+# Start the mail workers inside the serving process (after gunicorn forks),
+# so messages left in the outbox by a restart are retried
+@api.before_app_request
+def start_background_workers():
+    mail_dispatcher.start()
 
 # Add CORS headers to all responses
-@app.after_request
+@api.after_app_request
 def after_request(response):
     origin = request.headers.get('Origin', '')
     # Only allow specific origins
@@ -62,18 +78,19 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
+    response.headers.add('Access-Control-Expose-Headers', 'X-Next-Cursor')
     return response
 
-# Environment variables
-DEBUG = os.getenv('DEBUG', 'True') == 'True'
-HOST = os.getenv('HOST', '0.0.0.0')
-PORT = int(os.getenv('PORT', 5000))
-RECAPTCHA_SECRET_KEY = os.getenv('RECAPTCHA_SECRET_KEY', '')
-
-# Initialize database on app startup (works with gunicorn)
-with app.app_context():
-    # Create tables if not exist
+# Creates tables, indexes, the search index and seed data. Every step is
+# idempotent. Runs once per deploy (`flask --app app init-db`) before the
+# workers start, instead of in every worker at import time.
+def init_db():
     db.create_all()
+    ensure_product_geo(db.engine)
+    ensure_indexes(db.engine)
+    ensure_search_index(db.engine)
+    ensure_seller_stats(db.engine)
+    ensure_category_stats(db.engine)
     # Create initial categories if not exist
     if Category.query.count() == 0:
         categories = [
@@ -86,20 +103,49 @@ with app.app_context():
         ]
         db.session.add_all(categories)
         db.session.commit()
+
+@api.cli.command('init-db')
+def init_db_command():
+    init_db()
     print("Database initialized!")
 
 # Root endpoint
-@app.route('/', methods=['GET'])
+@api.route('/', methods=['GET'])
 def root():
     return jsonify({'message': 'Tarım Pazarı API', 'version': '1.0'})
 
 # Health check
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok', 'message': 'Backend is running'})
 
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+# Prometheus scrape endpoint: per-route latency, SQL and response size
+# metrics for this worker, plus cache and mail counters
+@api.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    cache = response_cache.stats()
+    mail = mail_dispatcher.stats()
+    order_events = event_stats()
+    admission = admission_stats()
+    return Response(metrics.render({
+        'tarim_cache_hits_total': ('counter', 'Response cache hits', cache['hits']),
+        'tarim_cache_misses_total': ('counter', 'Response cache misses', cache['misses']),
+        'tarim_mail_queued': ('gauge', 'Outbox messages waiting in the in-process queue', mail['queued']),
+        'tarim_mail_sent_total': ('counter', 'Mails delivered', mail['sent']),
+        'tarim_mail_failed_total': ('counter', 'Mails that exhausted their retries', mail['failed']),
+        'tarim_order_streams_open': ('gauge', 'Open order event streams', order_events['streams_open']),
+        'tarim_order_streams_max': ('gauge', 'Order event streams allowed per worker (0 = no cap)',
+                                    order_events['max_streams']),
+        'tarim_order_events_published_total': ('counter', 'Order events published', order_events['published']),
+        'tarim_requests_in_flight': ('gauge', 'Requests admitted and not yet finished', admission['in_flight'])
+    }), content_type=PROMETHEUS_CONTENT_TYPE)
+
 # ===== USER ENDPOINTS =====
-@app.route('/api/users/register', methods=['POST'])
+@api.route('/api/users/register', methods=['POST'])
 def register():
     data = request.get_json()
     
@@ -115,7 +161,7 @@ def register():
     user = User(
         username=data['username'],
         email=data['email'],
-        password=generate_password_hash(data['password']),
+        password=hash_password(data['password']),
         full_name=data['full_name'],
         role=data['role'],  # 'farmer' or 'producer'
         location=data.get('location', ''),
@@ -125,15 +171,9 @@ def register():
     db.session.add(user)
     db.session.commit()
     
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'full_name': user.full_name,
-        'role': user.role
-    }), 201
+    return jsonify(USER.serialize(user, USER.presets['registered'])), 201
 
-@app.route('/api/users/login', methods=['POST'])
+@api.route('/api/users/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
@@ -146,23 +186,20 @@ def login():
         if not user:
             user = User.query.filter_by(email=data['username']).first()
         
-        if not user or not check_password_hash(user.password, data['password']):
+        if not user or not verify_password(user.password, data['password']):
             return jsonify({'error': 'Invalid username/email or password'}), 401
         
-        return jsonify({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'full_name': user.full_name,
-            'role': user.role,
-            'location': user.location,
-            'phone': user.phone
-        }), 200
+        # Move the stored hash to the configured method and work factor
+        if needs_rehash(user.password):
+            user.password = hash_password(data['password'])
+            db.session.commit()
+        
+        return jsonify(USER.serialize(user, USER_SESSION)), 200
     except Exception as e:
         print(f"Login error: {str(e)}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
-@app.route('/api/users/google-login', methods=['POST'])
+@api.route('/api/users/google-login', methods=['POST'])
 def google_login():
     data = request.get_json()
     
@@ -174,15 +211,7 @@ def google_login():
     
     if user:
         # Existing Google user - just return user data
-        return jsonify({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'full_name': user.full_name,
-            'role': user.role,
-            'location': user.location,
-            'phone': user.phone
-        }), 200
+        return jsonify(USER.serialize(user, USER_SESSION)), 200
     
     # Check if email already exists
     user = User.query.filter_by(email=data['email']).first()
@@ -191,15 +220,7 @@ def google_login():
         if not user.google_id:
             user.google_id = data['google_id']
             db.session.commit()
-        return jsonify({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'full_name': user.full_name,
-            'role': user.role,
-            'location': user.location,
-            'phone': user.phone
-        }), 200
+        return jsonify(USER.serialize(user, USER_SESSION)), 200
     
     # New user - create account
     username = data['email'].split('@')[0]
@@ -223,9 +244,9 @@ def google_login():
     db.session.add(user)
     db.session.commit()
     
-    # Send welcome email
+    # Queue welcome email; it is sent in the background
     try:
-        msg = Message(
+        mail_dispatcher.enqueue(
             subject='Google ile Tarım Pazarı\'na Hoş Geldiniz',
             recipients=[user.email],
             html=f"""
@@ -260,39 +281,25 @@ def google_login():
             </div>
             """
         )
-        mail.send(msg)
     except Exception as e:
         print(f"Hoşgeldiniz e-postası gönderme hatası: {str(e)}")
     
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'full_name': user.full_name,
-        'role': user.role,
-        'location': user.location,
-        'phone': user.phone,
-        'message': 'Google ile kaydınız başarılı!'
-    }), 201
-
-@app.route('/api/users/<int:user_id>', methods=['GET'])
+    return jsonify(dict(USER.serialize(user, USER_SESSION), message='Google ile kaydınız başarılı!')), 201
+
+@api.route('/api/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
-    user = User.query.get(user_id)
+    try:
+        fields = USER.parse(request.args.get('fields'), 'profile')
+    except FieldError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    user = User.query.options(*USER.load_options(fields)).get(user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'full_name': user.full_name,
-        'role': user.role,
-        'location': user.location,
-        'phone': user.phone,
-        'description': user.description
-    })
+    return jsonify(USER.serialize(user, fields))
 
-@app.route('/api/users/<int:user_id>', methods=['PUT'])
+@api.route('/api/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     user = User.query.get(user_id)
     if not user:
@@ -312,30 +319,42 @@ def update_user(user_id):
     if 'description' in data:
         user.description = data['description']
     
+    # Products embed the seller's name, location and phone, orders only the
+    # names, and both derive their ETags from updated_at, so edits to those
+    # fields have to touch the rows too. Read the history before the first
+    # UPDATE: its autoflush clears it.
+    state = inspect(user).attrs
+    renamed = state.full_name.history.has_changes()
+    now = datetime.utcnow()
+    if renamed or state.location.history.has_changes() or state.phone.history.has_changes():
+        Product.query.filter_by(seller_id=user.id).update(
+            {Product.updated_at: now}, synchronize_session=False)
+    if renamed:
+        Order.query.filter(or_(Order.buyer_id == user.id, Order.seller_id == user.id)).update(
+            {Order.updated_at: now}, synchronize_session=False)
+    
     db.session.commit()
+    # Listings and details embed the seller's name and contact fields
+    response_cache.invalidate('products')
     
-    return jsonify({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'full_name': user.full_name,
-        'role': user.role,
-        'location': user.location,
-        'phone': user.phone,
-        'description': user.description
-    }), 200
+    return jsonify(USER.serialize(user, USER.presets['profile'])), 200
 
 # ===== CATEGORY ENDPOINTS =====
-@app.route('/api/categories', methods=['GET'])
+# Categories are only ever added, never edited
+def categories_version():
+    return db.session.query(func.count(Category.id), func.max(Category.id)).one()
+
+@api.route('/api/categories', methods=['GET'])
+@conditional(categories_version, 'public, max-age=300')
+@cached('categories', ttl=3600)
 def get_categories():
     categories = Category.query.all()
-    return jsonify([{
-        'id': c.id,
-        'name': c.name,
-        'description': c.description
-    } for c in categories])
+    serialize = CATEGORY.compile(CATEGORY.presets['default'])
+    with serialize_timer():
+        items = [serialize(c) for c in categories]
+    return jsonify(items)
 
-@app.route('/api/categories', methods=['POST'])
+@api.route('/api/categories', methods=['POST'])
 def create_category():
     data = request.get_json()
     
@@ -349,49 +368,154 @@ def create_category():
     
     db.session.add(category)
     db.session.commit()
+    response_cache.invalidate('categories', 'products')
     
-    return jsonify({
-        'id': category.id,
-        'name': category.name,
-        'description': category.description
-    }), 201
+    return jsonify(CATEGORY.serialize(category, CATEGORY.presets['default'])), 201
 
 # ===== PRODUCT ENDPOINTS =====
-@app.route('/api/products', methods=['GET'])
+PRODUCT_SORTS = {
+    'created_at': Product.created_at,
+    'price': Product.price,
+    'harvest_date': Product.harvest_date
+}
+NULLABLE_SORTS = {'harvest_date'}
+
+ORDER_SORTS = {
+    'created_at': Order.created_at,
+    'total_price': Order.total_price
+}
+
+# Deactivated products keep their rows and get a new updated_at, so counting
+# over all rows (not only active ones) still notices deletions
+def products_version():
+    query = db.session.query(func.count(Product.id), func.max(Product.updated_at))
+    if request.args.get('category_id'):
+        query = query.filter(Product.category_id == request.args.get('category_id'))
+    if request.args.get('seller_id'):
+        query = query.filter(Product.seller_id == request.args.get('seller_id'))
+    return query.one()
+
+def product_version(product_id):
+    return db.session.query(Product.updated_at).filter_by(id=product_id).scalar()
+
+# Next page token for keyset-paginated listings; the body stays a plain array
+def paginated(items, next_cursor):
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@api.route('/api/products', methods=['GET'])
+@conditional(products_version, 'public, no-cache')
+@cached('products', ttl=30)
 def get_products():
     category_id = request.args.get('category_id')
     seller_id = request.args.get('seller_id')
     search = request.args.get('search')
     
-    query = Product.query.filter_by(is_active=True)
+    try:
+        fields = PRODUCT.parse(request.args.get('fields'), 'listing')
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor') or request.args.get('after')
+        # near=lat,lon limits results to radius_km (default 50) around it
+        near = None
+        if request.args.get('near'):
+            near = parse_near(request.args['near'], request.args.get('radius_km'))
+        sorts = dict(PRODUCT_SORTS)
+        if search:
+            sorts['relevance'] = None
+        if near:
+            sorts['distance'] = None
+        default_sort = 'distance' if near else 'relevance' if search else 'created_at'
+        sort, descending = parse_sort(request.args.get('sort'), request.args.get('order'),
+                                      sorts, default_sort)
+    except (FieldError, PaginationError, NearError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Only the columns behind the requested fields are selected; seller and
+    # category names come from the same statement instead of lazy SELECTs
+    extra = ('created_at',) if sort in ('relevance', 'distance') else (sort,)
+    if near:
+        extra += ('latitude', 'longitude')
+    query = Product.query.options(*PRODUCT.load_options(fields, extra)).filter_by(is_active=True)
     
     if category_id:
         query = query.filter_by(category_id=category_id)
     if seller_id:
         query = query.filter_by(seller_id=seller_id)
+    
+    rank = None
     if search:
-        query = query.filter(Product.name.ilike(f'%{search}%'))
-    
-    products = query.all()
-    
-    return jsonify([{
-        'id': p.id,
-        'name': p.name,
-        'description': p.description,
-        'price': p.price,
-        'quantity': p.quantity,
-        'unit': p.unit,
-        'seller_id': p.seller_id,
-        'seller_name': p.seller.full_name,
-        'category_id': p.category_id,
-        'category_name': p.category.name,
-        'image_url': p.image_url,
-        'harvest_date': p.harvest_date.isoformat() if p.harvest_date else None,
-        'location': p.location,
-        'created_at': p.created_at.isoformat()
-    } for p in products])
-
-@app.route('/api/products', methods=['POST'])
+        query, rank = apply_search(query, search)
+    if sort == 'relevance' and rank is None:
+        # Nothing to rank by (no index or no search words)
+        sort, descending = 'created_at', True
+    if near:
+        query, distance = apply_near(query, *near)
+        if sort == 'distance':
+            rank = distance
+    
+    try:
+        column, key = PRODUCT_SORTS.get(sort), None
+        if sort in ('relevance', 'distance'):
+            # Lower rank is a better match; nearest first
+            query, column, descending = query.add_columns(rank), rank, False
+            key = lambda row: (row[1], row[0].id)
+        
+        # Streams send everything after the cursor; limit applies to pages
+        if wants_stream():
+            query = keyset_order(query, column, Product.id, sort, descending, cursor,
+                                 nullable=sort in NULLABLE_SORTS)
+        else:
+            rows, next_cursor = keyset_page(query, column, Product.id, sort, descending, limit, cursor,
+                                            nullable=sort in NULLABLE_SORTS, key=key)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    serialize = PRODUCT.compile(fields)
+    if near:
+        serialize_product = serialize
+        serialize = lambda p: dict(serialize_product(p), distance_km=distance_km(near[0], near[1], p))
+    if sort in ('relevance', 'distance'):
+        product_dict = lambda row: serialize(row[0])
+    else:
+        product_dict = serialize
+    
+    if wants_stream():
+        return stream_json(query.yield_per(STREAM_BATCH_SIZE), product_dict)
+    with serialize_timer():
+        items = [product_dict(p) for p in rows]
+    return paginated(items, next_cursor)
+
+# Orders move the per-category order counts without touching any product
+def facets_version():
+    return products_version(), db.session.query(func.max(Order.id)).scalar()
+
+# Counts per category, price bucket, province and unit for the same filters
+# as GET /api/products, so the catalog page can show them without loading
+# the listing. Unfiltered (or category-only) requests read the summary
+# tables; seller, search and near filters are counted with grouped SQL.
+@api.route('/api/products/facets', methods=['GET'])
+@conditional(facets_version, 'public, no-cache')
+@cached('products', ttl=30)
+def get_product_facets():
+    try:
+        category_id = int(request.args['category_id']) if request.args.get('category_id') else None
+        seller_id = int(request.args['seller_id']) if request.args.get('seller_id') else None
+        top = min(max(int(request.args.get('top', FACET_TOP_LOCATIONS)), 1), 81)
+    except ValueError:
+        return jsonify({'error': 'category_id, seller_id and top must be integers'}), 400
+    try:
+        near = None
+        if request.args.get('near'):
+            near = parse_near(request.args['near'], request.args.get('radius_km'))
+    except NearError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(product_facets(category_id=category_id, seller_id=seller_id,
+                                  search=request.args.get('search'), near=near, top=top))
+
+@api.route('/api/products', methods=['POST'])
 def create_product():
     # Get form data
     if 'name' not in request.form or 'price' not in request.form or 'quantity' not in request.form:
@@ -402,9 +526,9 @@ def create_product():
     if 'image' in request.files:
         file = request.files['image']
         if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(f"{int(datetime.now().timestamp())}_{file.filename}")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            extension = file.filename.rsplit('.', 1)[1].lower()
+            filename = save_upload(file, current_app.config['UPLOAD_FOLDER'], extension)
+            schedule_variants(current_app.config['UPLOAD_FOLDER'], filename)
             image_url = f'/api/uploads/{filename}'
     
     product = Product(
@@ -424,46 +548,42 @@ def create_product():
     
     db.session.add(product)
     db.session.commit()
+    response_cache.invalidate('products')
     
-    return jsonify({
-        'id': product.id,
-        'name': product.name,
-        'price': product.price,
-        'quantity': product.quantity,
-        'image_url': product.image_url
-    }), 201
+    return jsonify(PRODUCT.serialize(product, PRODUCT.presets['created'])), 201
 
 # Serve uploaded files
-@app.route('/api/uploads/<filename>')
+@api.route('/api/uploads/<filename>')
 def download_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+    filename = secure_filename(filename)
+    folder = current_app.config['UPLOAD_FOLDER']
+    response = send_upload(folder, filename, cache_policy(filename))
+    if response is None:
+        # Variant not generated yet (or lost): serve the original meanwhile
+        original = original_for_variant(folder, filename)
+        if original:
+            schedule_variants(folder, original)
+            response = send_upload(folder, original, 'no-cache')
+    if response is None:
+        return jsonify({'error': 'File not found'}), 404
+    return response
 
-@app.route('/api/products/<int:product_id>', methods=['GET'])
+@api.route('/api/products/<int:product_id>', methods=['GET'])
+@conditional(product_version, 'public, max-age=30')
+@cached('products', ttl=300)
 def get_product(product_id):
-    product = Product.query.get(product_id)
+    try:
+        fields = PRODUCT.parse(request.args.get('fields'), 'detail')
+    except FieldError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    product = Product.query.options(*PRODUCT.load_options(fields)).get(product_id)
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
-    return jsonify({
-        'id': product.id,
-        'name': product.name,
-        'description': product.description,
-        'price': product.price,
-        'quantity': product.quantity,
-        'unit': product.unit,
-        'seller_id': product.seller_id,
-        'seller_name': product.seller.full_name,
-        'seller_location': product.seller.location,
-        'seller_phone': product.seller.phone,
-        'category_id': product.category_id,
-        'category_name': product.category.name,
-        'image_url': product.image_url,
-        'harvest_date': product.harvest_date.isoformat() if product.harvest_date else None,
-        'location': product.location,
-        'created_at': product.created_at.isoformat()
-    })
+    return jsonify(PRODUCT.serialize(product, fields))
 
-@app.route('/api/products/<int:product_id>', methods=['PUT'])
+@api.route('/api/products/<int:product_id>', methods=['PUT'])
 def update_product(product_id):
     product = Product.query.get(product_id)
     if not product:
@@ -486,10 +606,11 @@ def update_product(product_id):
     
     product.updated_at = datetime.utcnow()
     db.session.commit()
+    response_cache.invalidate('products')
     
     return jsonify({'message': 'Product updated successfully'})
 
-@app.route('/api/products/<int:product_id>', methods=['DELETE'])
+@api.route('/api/products/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
     product = Product.query.get(product_id)
     if not product:
@@ -497,11 +618,12 @@ def delete_product(product_id):
     
     product.is_active = False
     db.session.commit()
+    response_cache.invalidate('products')
     
     return jsonify({'message': 'Product deleted successfully'})
 
 # ===== ORDER ENDPOINTS =====
-@app.route('/api/orders', methods=['POST'])
+@api.route('/api/orders', methods=['POST'])
 def create_order():
     data = request.get_json()
     
@@ -509,48 +631,207 @@ def create_order():
     if not data or not all(k in data for k in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    product = Product.query.get(data['product_id'])
-    if not product:
-        return jsonify({'error': 'Product not found'}), 404
+    try:
+        quantity = int(data['quantity'])
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity < 1:
+        return jsonify({'error': 'Quantity must be a positive integer'}), 400
+    notes = data.get('notes', '')
+    if not valid_notes(notes):
+        return jsonify({'error': 'Notes must be a string'}), 400
     
-    if product.quantity < data['quantity']:
+    def place_order():
+        product = db.session.get(Product, data['product_id'])
+        if not product:
+            return None
+        
+        # Reduce product quantity; fails instead of overselling
+        reserve_stock(product.id, quantity)
+        
+        order = Order(
+            product_id=product.id,
+            seller_id=data['seller_id'],
+            buyer_id=data['buyer_id'],
+            quantity=quantity,
+            unit_price=product.price,
+            total_price=product.price * quantity,
+            notes=notes
+        )
+        db.session.add(order)
+        record_order(order)
+        record_category_order(product.category_id, quantity, order.total_price)
+        db.session.commit()
+        return order
+    
+    try:
+        order = with_retries(place_order)
+    except InsufficientStock:
+        db.session.rollback()
         return jsonify({'error': 'Insufficient quantity'}), 400
+    if order is None:
+        return jsonify({'error': 'Product not found'}), 404
     
-    unit_price = product.price
-    total_price = unit_price * data['quantity']
-    
-    order = Order(
-        product_id=data['product_id'],
-        seller_id=data['seller_id'],
-        buyer_id=data['buyer_id'],
-        quantity=data['quantity'],
-        unit_price=unit_price,
-        total_price=total_price,
-        notes=data.get('notes', '')
-    )
+    # Quantity changed
+    response_cache.invalidate('products')
+    publish_order_event('order.created', ORDER.serialize(order, ORDER.presets['event']))
     
-    # Reduce product quantity
-    product.quantity -= data['quantity']
+    return jsonify(ORDER.serialize(order, ORDER.presets['created'])), 201
+
+MAX_CHECKOUT_ITEMS = 100
+
+# Ids and quantities from JSON: integers, or strings of digits; anything else
+# (lists, floats, booleans) is None
+def positive_int(value):
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        return None
+    return value
+
+# Order notes are free text; null means none
+def valid_notes(value):
+    return value is None or isinstance(value, str)
+
+# Places several orders in one transaction. Every line is validated against
+# one IN query on products, stock is reserved per line with the same
+# conditional UPDATE as create_order, and the orders go in as one multi-row
+# INSERT. Without allow_partial a single failing line cancels the cart.
+@api.route('/api/orders/batch', methods=['POST'])
+def create_orders_batch():
+    data = request.get_json()
     
-    db.session.add(order)
-    db.session.commit()
+    if not data or 'buyer_id' not in data or not isinstance(data.get('items'), list) or not data['items']:
+        return jsonify({'error': 'Missing required fields'}), 400
+    if len(data['items']) > MAX_CHECKOUT_ITEMS:
+        return jsonify({'error': f'At most {MAX_CHECKOUT_ITEMS} items per checkout'}), 400
+    buyer_id = positive_int(data['buyer_id'])
+    if buyer_id is None:
+        return jsonify({'error': 'buyer_id must be a positive integer'}), 400
+    allow_partial = bool(data.get('allow_partial', False))
+    
+    lines = []
+    for index, item in enumerate(data['items']):
+        item = item if isinstance(item, dict) else {}
+        line = {'index': index, 'product_id': item.get('product_id'),
+                'quantity': positive_int(item.get('quantity')), 'notes': item.get('notes', ''), 'error': None}
+        product_id = positive_int(line['product_id'])
+        if product_id is None:
+            line['error'] = 'product_id must be a positive integer'
+        elif line['quantity'] is None:
+            line['error'] = 'Quantity must be a positive integer'
+        elif not valid_notes(line['notes']):
+            line['error'] = 'Notes must be a string'
+        else:
+            line['product_id'] = product_id
+        lines.append(line)
     
-    return jsonify({
-        'id': order.id,
-        'product_id': order.product_id,
-        'quantity': order.quantity,
-        'unit_price': order.unit_price,
-        'total_price': order.total_price,
-        'status': order.status
-    }), 201
+    # Returns {line index: order row or error message}, committing the
+    # orders unless the cart has to be cancelled
+    def checkout():
+        outcome = {}
+        product_ids = {line['product_id'] for line in lines if not line['error']}
+        products = {p.id: p for p in db.session.query(
+            Product.id, Product.price, Product.seller_id, Product.category_id
+        ).filter(Product.id.in_(product_ids))}
+        
+        rows = []
+        for line in lines:
+            product = None if line['error'] else products.get(line['product_id'])
+            if line['error']:
+                outcome[line['index']] = line['error']
+            elif not product:
+                outcome[line['index']] = 'Product not found'
+            else:
+                try:
+                    reserve_stock(product.id, line['quantity'])
+                except InsufficientStock:
+                    outcome[line['index']] = 'Insufficient quantity'
+                    continue
+                row = {
+                    'product_id': product.id,
+                    'seller_id': product.seller_id,
+                    'buyer_id': buyer_id,
+                    'quantity': line['quantity'],
+                    'unit_price': product.price,
+                    'total_price': product.price * line['quantity'],
+                    'notes': line['notes']
+                }
+                outcome[line['index']] = row
+                rows.append(row)
+        
+        if not rows or (len(rows) < len(lines) and not allow_partial):
+            db.session.rollback()
+            return {i: result for i, result in outcome.items() if isinstance(result, str)}
+        
+        order_ids = db.session.scalars(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True), rows
+        ).all()
+        for row, order_id in zip(rows, order_ids):
+            row['id'] = order_id
+            record_order(row)
+            record_category_order(products[row['product_id']].category_id, row['quantity'], row['total_price'])
+        db.session.commit()
+        return outcome
+    
+    outcome = with_retries(checkout)
+    created = any(isinstance(result, dict) for result in outcome.values())
+    if created:
+        response_cache.invalidate('products')
+        for result in outcome.values():
+            if isinstance(result, dict):
+                publish_order_event('order.created', dict(result, status='pending'))
+    
+    results = []
+    for line in lines:
+        result = outcome.get(line['index'], 'Not placed because another item failed')
+        if isinstance(result, dict):
+            results.append({'index': line['index'], 'product_id': line['product_id'], 'status': 'created', 'order': {
+                'id': result['id'],
+                'product_id': result['product_id'],
+                'quantity': result['quantity'],
+                'unit_price': result['unit_price'],
+                'total_price': result['total_price'],
+                'status': 'pending'
+            }})
+        else:
+            results.append({'index': line['index'], 'product_id': line['product_id'],
+                            'status': 'failed', 'error': result})
+    
+    if not created:
+        return jsonify({'error': 'Checkout failed', 'results': results}), 400
+    return jsonify({'results': results}), 201
+
+# Order rows embed the product name, so product edits count as well
+def orders_version():
+    query = db.session.query(
+        func.count(Order.id), func.max(Order.updated_at), func.max(Product.updated_at)
+    ).join(Product, Order.product_id == Product.id)
+    if request.args.get('buyer_id'):
+        query = query.filter(Order.buyer_id == request.args.get('buyer_id'))
+    if request.args.get('seller_id'):
+        query = query.filter(Order.seller_id == request.args.get('seller_id'))
+    if request.args.get('status'):
+        query = query.filter(Order.status == request.args.get('status'))
+    return query.one()
 
-@app.route('/api/orders', methods=['GET'])
+@api.route('/api/orders', methods=['GET'])
+@conditional(orders_version, 'private, no-cache')
 def get_orders():
     buyer_id = request.args.get('buyer_id')
     seller_id = request.args.get('seller_id')
     status = request.args.get('status')
     
-    query = Order.query
+    try:
+        fields = ORDER.parse(request.args.get('fields'), 'listing')
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor') or request.args.get('after')
+        sort, descending = parse_sort(request.args.get('sort'), request.args.get('order'),
+                                      ORDER_SORTS, 'created_at')
+    except (FieldError, PaginationError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = Order.query.options(*ORDER.load_options(fields, (sort,)))
     
     if buyer_id:
         query = query.filter_by(buyer_id=buyer_id)
@@ -559,31 +840,34 @@ def get_orders():
     if status:
         query = query.filter_by(status=status)
     
-    orders = query.all()
-    
-    return jsonify([{
-        'id': o.id,
-        'product_id': o.product_id,
-        'product_name': o.product.name,
-        'seller_id': o.seller_id,
-        'seller_name': o.seller_user.full_name,
-        'buyer_id': o.buyer_id,
-        'buyer_name': o.buyer_user.full_name,
-        'quantity': o.quantity,
-        'unit_price': o.unit_price,
-        'total_price': o.total_price,
-        'status': o.status,
-        'created_at': o.created_at.isoformat(),
-        'notes': o.notes
-    } for o in orders])
-
-@app.route('/api/orders/<int:order_id>', methods=['PUT'])
+    try:
+        # Streams send everything after the cursor; limit applies to pages
+        if wants_stream():
+            query = keyset_order(query, ORDER_SORTS[sort], Order.id, sort, descending, cursor)
+        else:
+            orders, next_cursor = keyset_page(query, ORDER_SORTS[sort], Order.id, sort, descending, limit, cursor)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if wants_stream():
+        return stream_json(query.yield_per(STREAM_BATCH_SIZE), ORDER.compile(fields))
+    serialize = ORDER.compile(fields)
+    with serialize_timer():
+        items = [serialize(o) for o in orders]
+    return paginated(items, next_cursor)
+
+# Editable order fields, as pushed to order stream subscribers
+ORDER_EVENT_FIELDS = ('status', 'delivery_date', 'notes')
+
+@api.route('/api/orders/<int:order_id>', methods=['PUT'])
 def update_order(order_id):
     order = Order.query.get(order_id)
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     
     data = request.get_json()
+    old_status = order.status
+    previous = {field: getattr(order, field) for field in ORDER_EVENT_FIELDS}
     
     if 'status' in data:
         order.status = data['status']
@@ -593,31 +877,161 @@ def update_order(order_id):
         order.notes = data['notes']
     
     order.updated_at = datetime.utcnow()
+    record_status_change(order, old_status)
     db.session.commit()
     
+    # Only the fields that changed are pushed to stream subscribers
+    changes = {field: getattr(order, field) for field in ORDER_EVENT_FIELDS
+               if getattr(order, field) != previous[field]}
+    if changes:
+        if 'delivery_date' in changes and changes['delivery_date']:
+            changes['delivery_date'] = changes['delivery_date'].isoformat()
+        if 'status' in changes:
+            changes['previous_status'] = old_status
+        publish_order_event('order.updated', dict(changes, id=order.id, buyer_id=order.buyer_id,
+                                                  seller_id=order.seller_id,
+                                                  updated_at=order.updated_at.isoformat()))
+    
     return jsonify({'message': 'Order updated successfully', 'status': order.status})
 
-if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        
-        # Create initial categories
-        if Category.query.count() == 0:
-            categories = [
-                Category(name='Tahıl', description='Buğday, arpa, çavdar'),
-                Category(name='Sebze', description='Domates, biber, salatalık'),
-                Category(name='Meyve', description='Elma, armut, üzüm'),
-                Category(name='Hayvansal Ürünler', description='Süt, yumurta, et'),
-                Category(name='Yağlı Tohumlar', description='Ayçiçeği, kanola'),
-                Category(name='Diğer', description='Diğer tarım ürünleri')
-            ]
-            db.session.add_all(categories)
-            db.session.commit()
+# Server-Sent Events for one user's orders, as buyer or seller: `order.created`
+# and `order.updated` (changed fields only), resumable with Last-Event-ID.
+# A `reset` event means updates were missed and GET /api/orders should be
+# refetched. The generator does not touch the database or the request
+# context, so an open stream holds no connection from the pool, but it does
+# hold a worker thread: past EVENTS_MAX_STREAMS per worker the answer is 503,
+# and clients fall back to polling GET /api/orders.
+@api.route('/api/orders/stream', methods=['GET'])
+def stream_orders():
+    user_id = request.args.get('user_id', type=int)
+    if not user_id:
+        return jsonify({'error': 'user_id is required'}), 400
+    
+    if not open_stream():
+        metrics.inc('tarim_shed_total', (('class', 'stream'), ('reason', 'concurrency')))
+        response = jsonify({'error': 'Too many open order streams, poll GET /api/orders instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(EVENTS_RETRY_MS // 1000, 1))
+        return response
+    
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(order_stream(user_id, last_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # nginx and similar proxies would otherwise buffer the stream
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(close_stream)
+    return response
+
+# ===== SELLER ENDPOINTS =====
+# Dashboard figures come from the seller summary tables, so the cost does
+# not grow with order history
+@api.route('/api/sellers/<int:seller_id>/stats', methods=['GET'])
+def get_seller_stats(seller_id):
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 366)
+        low_stock = int(request.args.get('low_stock', 10))
+        top = min(max(int(request.args.get('top', 5)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'days, low_stock and top must be integers'}), 400
+    
+    return jsonify(seller_stats(seller_id, days=days, top=top, low_stock=low_stock))
+
+# Bulk listing for large sellers: a CSV (header row with at least name,
+# price, quantity) or NDJSON body, or the same as a multipart `file`. Rows
+# are validated and inserted as they are read; invalid ones are skipped and
+# reported by line number. ?dry_run=1 only validates. Batches are committed
+# as they fill, so when the file turns unreadable partway (encoding, broken
+# CSV) the rows before that point stay imported: the answer is then 207 with
+# `error` and the `imported` count rather than a 400.
+@api.route('/api/sellers/<int:seller_id>/products/import', methods=['POST'])
+def import_seller_products(seller_id):
+    if not db.session.get(User, seller_id):
+        return jsonify({'error': 'Seller not found'}), 404
+    
+    stream, filename = request.stream, None
+    if request.mimetype == 'multipart/form-data':
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        stream, filename = request.files['file'].stream, request.files['file'].filename
+    dry_run = request.args.get('dry_run') in ('1', 'true')
+    
+    try:
+        fmt = import_format(request.args.get('format'), request.mimetype, filename)
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    summary = import_products(seller_id, read_rows(stream, fmt), dry_run=dry_run)
+    if summary['imported'] and not dry_run:
+        response_cache.invalidate('products')
+    
+    if 'error' in summary and summary['imported'] and not dry_run:
+        return jsonify(summary), 207
+    if 'error' in summary or not summary['imported']:
+        summary.setdefault('error', 'No valid rows')
+        return jsonify(summary), 400
+    return jsonify(summary), 200 if dry_run else 201
+
+# The seller's active catalog as CSV (default, re-importable) or
+# ?format=ndjson, streamed in constant memory
+@api.route('/api/sellers/<int:seller_id>/products/export', methods=['GET'])
+def export_seller_products(seller_id):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    rows = export_query(seller_id).yield_per(STREAM_BATCH_SIZE)
+    if fmt == 'csv':
+        response = stream_csv(rows, EXPORT_COLUMNS, export_row)
+    else:
+        response = stream_json(rows, export_row)
+    response.headers['Content-Disposition'] = f'attachment; filename=products-{seller_id}.{fmt}'
+    return response
+
+def create_app():
+    app = Flask(__name__)
+    if TRUSTED_PROXIES:
+        # Each hop appends to X-Forwarded-For, but X-Forwarded-Proto is set
+        # once by the proxy nearest to the app
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=1)
     
-    # Use PORT environment variable for Railway
-    port = int(os.getenv('PORT', 5000))
+    # Database configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url(f'sqlite:///{os.path.join(basedir, "tarim_pazari.db")}')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = replica_binds()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
-    # Initialize database on startup
+    # Upload configuration
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    
+    # Mail configuration
+    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True') == 'True'
+    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
+    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
+    app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@tarim-pazari.com')
+    
+    db.init_app(app)
+    # First, so its after_request hook runs last and times the others
+    init_metrics(app)
+    init_rate_limits(app, client_ip_known=bool(TRUSTED_PROXIES))
+    init_replica_routing(app)
+    mail_dispatcher.init_app(app)
+    
+    # CORS configuration - restricted to allowed origins
+    CORS(app, origins=ALLOWED_ORIGINS, supports_credentials=True)
+    
+    app.register_blueprint(api)
+    return app
+
+# Module-level instance for `gunicorn app:app` and `flask --app app`
+app = create_app()
+
+if __name__ == '__main__':
+    # Local development: a single process, so initializing here is safe
     with app.app_context():
-        db.create_all()
-        print("Database initialized")
+        init_db()
+    app.run(host=HOST, port=PORT, debug=DEBUG)
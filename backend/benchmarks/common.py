@@ -0,0 +1,75 @@
+import json
+import os
+import sys
+import tempfile
+
+
+# Points the app at a throwaway SQLite file, or at BENCH_DATABASE_URL (an
+# empty database, e.g. the Postgres service in docker-compose.yml) when set.
+# Must run before `import app`, which reads DATABASE_URL at import time.
+# Also turns the rate limits off: every benchmark request comes from the
+# same client address.
+def use_temp_database():
+    directory = tempfile.mkdtemp(prefix='tarim-bench-')
+    os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or 'sqlite:///' + os.path.join(directory, 'bench.db')
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'False')
+    return directory
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+# latencies in seconds; elapsed is the wall time of the whole run
+def summarize(name, latencies, elapsed, **extra):
+    values = sorted(latencies)
+    result = {
+        'name': name,
+        'requests': len(values),
+        'rps': round(len(values) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3)
+    }
+    result.update(extra)
+    return result
+
+
+def emit(results, path=None):
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if path:
+        with open(path, 'w') as f:
+            f.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+# Annotates each result with the matching baseline run (by name) and the
+# relative change, and returns the names whose p95 grew by more than
+# `threshold` (0.1 = 10%) or whose throughput dropped by more than that
+def compare(results, baseline, threshold=0.1):
+    previous = {result['name']: result for result in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get(result['name'])
+        if base is None:
+            continue
+        result['baseline'] = {key: base.get(key) for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps')}
+        result['change'] = {
+            key: round((result[key] - base[key]) / base[key], 4) if base.get(key) else None
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps')
+        }
+        slower = base.get('p95_ms') and result['p95_ms'] > base['p95_ms'] * (1 + threshold)
+        fewer = base.get('rps') and result['rps'] < base['rps'] * (1 - threshold)
+        if slower or fewer:
+            regressions.append(result['name'])
+    return regressions
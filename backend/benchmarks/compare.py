@@ -0,0 +1,27 @@
+# Compares the JSON output of any benchmark here with a baseline run of the
+# same benchmark and exits with status 1 on regressions.
+#
+#   cd backend && python -m benchmarks.compare current.json baseline.json --threshold 0.15
+import argparse
+import sys
+from benchmarks.common import load, compare, emit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('current')
+    parser.add_argument('baseline')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    results = load(args.current)
+    regressions = compare(results, load(args.baseline), args.threshold)
+    emit(results, args.output)
+    if regressions:
+        sys.stderr.write(f"Regressions: {', '.join(regressions)}\n")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# Synthetic marketplace data: farmers selling products across the seeded
+# categories, buyers, and orders between them spread over the last 90 days.
+#
+#   cd backend && python -m benchmarks.datagen sqlite:////tmp/tarim-load.db \
+#       --farmers 50 --products 5000 --orders 20000
+#
+# The database is initialized (init-db) first and should be empty: the
+# generated usernames are fixed, so running twice against one database fails.
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+PRODUCE = {
+    'Tahıl': ['Buğday', 'Arpa', 'Çavdar', 'Mısır', 'Yulaf', 'Pirinç'],
+    'Sebze': ['Domates', 'Biber', 'Salatalık', 'Patlıcan', 'Soğan', 'Patates', 'Ispanak'],
+    'Meyve': ['Elma', 'Armut', 'Üzüm', 'Kayısı', 'Kiraz', 'Portakal', 'İncir', 'Fındık'],
+    'Hayvansal Ürünler': ['Süt', 'Yumurta', 'Peynir', 'Bal', 'Tereyağı', 'Yoğurt'],
+    'Yağlı Tohumlar': ['Ayçiçeği', 'Kanola', 'Susam', 'Soya', 'Aspir'],
+    'Diğer': ['Pamuk', 'Tütün', 'Şeker Pancarı', 'Çay', 'Lavanta']
+}
+QUALITIES = ['Organik', 'Taze', 'Yerli', 'Köy', 'Doğal', 'Birinci Sınıf']
+LOCATIONS = ['Konya', 'Ankara', 'Antalya', 'İzmir', 'Bursa', 'Adana', 'Şanlıurfa', 'Samsun', 'Manisa', 'Tokat']
+UNITS = ['kg', 'ton', 'adet', 'litre']
+STATUSES = ['pending', 'confirmed', 'shipped', 'delivered', 'delivered', 'cancelled']
+BATCH_SIZE = 1000
+
+
+# Must run inside an app context. Products go through the ORM so the search
+# index events fire; orders are bulk inserted and the seller and category
+# summary tables are backfilled from them afterwards. Returns the generated ids.
+def generate(farmers=20, buyers=50, products=1000, orders=2000, seed=42):
+    from sqlalchemy import insert
+    from models import db, User, Product, Category, Order
+    from stats import ensure_seller_stats
+    from facets import ensure_category_stats
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    categories = {c.name: c.id for c in Category.query.all()}
+
+    users = [User(username=f'farmer{i}', email=f'farmer{i}@example.com', full_name=f'Çiftçi {i}',
+                  role='farmer', location=rng.choice(LOCATIONS)) for i in range(farmers)]
+    users += [User(username=f'buyer{i}', email=f'buyer{i}@example.com', full_name=f'Alıcı {i}',
+                   role='producer', location=rng.choice(LOCATIONS)) for i in range(buyers)]
+    db.session.add_all(users)
+    db.session.commit()
+    farmer_ids = [u.id for u in users[:farmers]]
+    buyer_ids = [u.id for u in users[farmers:]]
+
+    catalog = []
+    for i in range(products):
+        category = rng.choice(list(PRODUCE))
+        name = f'{rng.choice(QUALITIES)} {rng.choice(PRODUCE[category])}'
+        product = Product(
+            name=name,
+            description=f'{rng.choice(LOCATIONS)} yöresinden {name.lower()}, hasat {rng.randint(1, 12)}. ay',
+            price=round(rng.uniform(5, 500), 2),
+            quantity=rng.randint(1000, 100000),
+            unit=rng.choice(UNITS),
+            seller_id=rng.choice(farmer_ids),
+            category_id=categories.get(category),
+            location=rng.choice(LOCATIONS),
+            harvest_date=now - timedelta(days=rng.randint(0, 120)),
+            created_at=now - timedelta(minutes=rng.randint(0, 60 * 24 * 180))
+        )
+        catalog.append(product)
+        db.session.add(product)
+        if len(catalog) % BATCH_SIZE == 0:
+            db.session.commit()
+    db.session.commit()
+    product_rows = [(p.id, p.seller_id, p.price) for p in catalog]
+
+    rows = []
+    for i in range(orders):
+        product_id, seller_id, price = rng.choice(product_rows)
+        quantity = rng.randint(1, 20)
+        rows.append({
+            'product_id': product_id,
+            'seller_id': seller_id,
+            'buyer_id': rng.choice(buyer_ids),
+            'quantity': quantity,
+            'unit_price': price,
+            'total_price': round(price * quantity, 2),
+            'status': rng.choice(STATUSES),
+            'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+        })
+        if len(rows) == BATCH_SIZE or i == orders - 1:
+            db.session.execute(insert(Order), rows)
+            rows = []
+    db.session.commit()
+    ensure_seller_stats(db.engine)
+    # Product counts came from the mapper events, order totals did not
+    ensure_category_stats(db.engine, rebuild=True)
+
+    return {'farmer_ids': farmer_ids, 'buyer_ids': buyer_ids, 'product_ids': [row[0] for row in product_rows]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('database_url')
+    parser.add_argument('--farmers', type=int, default=50)
+    parser.add_argument('--buyers', type=int, default=200)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import app, init_db
+
+    started = time.perf_counter()
+    with app.app_context():
+        init_db()
+        generate(args.farmers, args.buyers, args.products, args.orders, args.seed)
+    print(f'Generated {args.farmers} farmers, {args.buyers} buyers, {args.products} products and '
+          f'{args.orders} orders in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
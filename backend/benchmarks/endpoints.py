@@ -0,0 +1,114 @@
+# Per-endpoint latency through the Flask test client (no network or server
+# overhead) against generated data in a throwaway database.
+#
+#   cd backend && python -m benchmarks.endpoints --output baseline.json
+#   ...change something...
+#   cd backend && python -m benchmarks.endpoints --compare baseline.json
+#
+# Read endpoints are served from the response cache once warm, which is what
+# production sees for hot pages; --no-cache adds a unique query parameter to
+# every request to measure the uncached path instead.
+import argparse
+import itertools
+import random
+import sys
+import time
+from benchmarks.common import use_temp_database, summarize, emit, load, compare
+
+SEARCH_TERMS = ['domates', 'elma', 'organik bu', 'süt', 'fındık', 'taze biber', 'yerli üzüm', 'bal']
+
+
+def scenarios(data, rng):
+    products = data['product_ids']
+    farmers = data['farmer_ids']
+    buyers = data['buyer_ids']
+    sellers = data['sellers']
+    return {
+        'categories': lambda client, q: client.get(f'/api/categories?{q}'),
+        'browse': lambda client, q: client.get(f'/api/products?limit=20&category_id={rng.randint(1, 6)}&{q}'),
+        'browse_deep': lambda client, q: client.get(f'/api/products?limit=20&cursor={rng.choice(data["cursors"])}&{q}'),
+        'browse_price': lambda client, q: client.get(f'/api/products?limit=20&sort=price&order=asc&{q}'),
+        'search': lambda client, q: client.get(f'/api/products?limit=20&search={rng.choice(SEARCH_TERMS)}&{q}'),
+        'detail': lambda client, q: client.get(f'/api/products/{rng.choice(products)}?{q}'),
+        'seller_orders': lambda client, q: client.get(f'/api/orders?seller_id={rng.choice(farmers)}&limit=50&{q}'),
+        'dashboard': lambda client, q: client.get(f'/api/sellers/{rng.choice(farmers)}/stats?{q}'),
+        'checkout': lambda client, q: client.post('/api/orders', json=dict(
+            rng.choice(sellers), buyer_id=rng.choice(buyers), quantity=1
+        )),
+        'batch_checkout': lambda client, q: client.post('/api/orders/batch', json={
+            'buyer_id': rng.choice(buyers),
+            'items': [{'product_id': line['product_id'], 'quantity': 1} for line in rng.sample(sellers, 5)]
+        })
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--farmers', type=int, default=20)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', help='comma separated scenario names')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    use_temp_database()
+    from app import app, init_db
+    from models import Product
+    from benchmarks.datagen import generate
+
+    with app.app_context():
+        init_db()
+        data = generate(farmers=args.farmers, products=args.products, orders=args.orders, seed=args.seed)
+        data['sellers'] = [{'product_id': p.id, 'seller_id': p.seller_id}
+                           for p in Product.query.with_entities(Product.id, Product.seller_id)]
+
+    client = app.test_client()
+    # Cursors a few pages into the default listing, for deep pagination
+    data['cursors'] = []
+    cursor = ''
+    for _ in range(10):
+        cursor = client.get(f'/api/products?limit=20&cursor={cursor}').headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        data['cursors'].append(cursor)
+    if not data['cursors']:
+        data['cursors'] = ['']
+
+    rng = random.Random(args.seed)
+    selected = scenarios(data, rng)
+    if args.only:
+        selected = {name: selected[name] for name in args.only.split(',')}
+    unique = itertools.count()
+
+    results = []
+    for name, run in selected.items():
+        for _ in range(args.warmup):
+            run(client, '')
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            query = f'_={next(unique)}' if args.no_cache else ''
+            start = time.perf_counter()
+            response = run(client, query)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+        results.append(summarize(name, latencies, time.perf_counter() - started,
+                                 errors=errors, cached=not args.no_cache))
+
+    regressions = compare(results, load(args.compare), args.threshold) if args.compare else []
+    emit(results, args.output)
+    if regressions:
+        sys.stderr.write(f"Regressions: {', '.join(regressions)}\n")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# End-to-end load against a running server: catalog browsing, search,
+# product pages, checkout and the seller dashboard in a rough production mix.
+# Needs `pip install locust`, which the app itself does not depend on.
+#
+#   cd backend
+#   python -m benchmarks.datagen sqlite:////tmp/tarim-load.db --products 5000 --orders 20000
+#   DATABASE_URL=sqlite:////tmp/tarim-load.db RATE_LIMIT_ENABLED=False \
+#       gunicorn app:app --preload -w 4 -b 127.0.0.1:8000
+#   BENCH_OUTPUT=load.json locust -f benchmarks/locustfile.py --host http://127.0.0.1:8000 \
+#       --headless -u 100 -r 20 -t 2m
+#
+# BENCH_OUTPUT gets the same JSON as the other benchmarks (p50/p95/p99 and
+# rps per request name), so `python -m benchmarks.compare` works on it.
+import os
+import random
+import sys
+import requests
+from locust import HttpUser, between, events, task
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.common import emit
+
+SEARCH_TERMS = ['domates', 'elma', 'organik bu', 'süt', 'fındık', 'taze biber', 'yerli üzüm', 'bal']
+
+# Filled from the API when the test starts, so any populated database works
+catalog = {'products': [], 'sellers': [], 'buyers': []}
+
+
+@events.test_start.add_listener
+def discover(environment, **kwargs):
+    response = requests.get(f'{environment.host}/api/products', params={'limit': 200, 'fields': 'id,seller_id'})
+    response.raise_for_status()
+    catalog['products'] = response.json()
+    catalog['sellers'] = sorted({p['seller_id'] for p in catalog['products']})
+    orders = requests.get(f'{environment.host}/api/orders', params={'limit': 200, 'fields': 'buyer_id'}).json()
+    catalog['buyers'] = sorted({o['buyer_id'] for o in orders}) or catalog['sellers']
+
+
+@events.quitting.add_listener
+def report(environment, **kwargs):
+    results = []
+    for (name, method), entry in sorted(environment.stats.entries.items()):
+        if not entry.num_requests:
+            continue
+        results.append({
+            'name': f'{method} {name}',
+            'requests': entry.num_requests,
+            'rps': round(entry.total_rps, 2),
+            'p50_ms': entry.get_response_time_percentile(0.5),
+            'p95_ms': entry.get_response_time_percentile(0.95),
+            'p99_ms': entry.get_response_time_percentile(0.99),
+            'failures': entry.num_failures
+        })
+    emit(results, os.getenv('BENCH_OUTPUT'))
+
+
+class Buyer(HttpUser):
+    wait_time = between(0.5, 2)
+    weight = 9
+
+    @task(10)
+    def browse(self):
+        response = self.client.get('/api/products', params={'limit': 20, 'category_id': random.randint(1, 6)},
+                                   name='/api/products?category_id')
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor and random.random() < 0.3:
+            self.client.get('/api/products', params={'limit': 20, 'cursor': cursor}, name='/api/products?cursor')
+
+    @task(5)
+    def search(self):
+        self.client.get('/api/products', params={'limit': 20, 'search': random.choice(SEARCH_TERMS)},
+                        name='/api/products?search')
+
+    @task(6)
+    def detail(self):
+        product = random.choice(catalog['products'])
+        self.client.get(f"/api/products/{product['id']}", name='/api/products/[id]')
+
+    @task(1)
+    def checkout(self):
+        product = random.choice(catalog['products'])
+        self.client.post('/api/orders', json={
+            'product_id': product['id'],
+            'seller_id': product['seller_id'],
+            'buyer_id': random.choice(catalog['buyers']),
+            'quantity': 1
+        })
+
+
+class Seller(HttpUser):
+    wait_time = between(2, 5)
+    weight = 1
+
+    @task(3)
+    def dashboard(self):
+        self.client.get(f"/api/sellers/{random.choice(catalog['sellers'])}/stats", name='/api/sellers/[id]/stats')
+
+    @task(1)
+    def orders(self):
+        self.client.get('/api/orders', params={'seller_id': random.choice(catalog['sellers']), 'limit': 50},
+                        name='/api/orders?seller_id')
@@ -0,0 +1,79 @@
+# Login throughput with the configured password hashing cost.
+#
+#   cd backend && python -m benchmarks.login --threads 8 --duration 10
+#
+# PASSWORD_HASH_METHOD and PASSWORD_HASH_WORKERS are read from the
+# environment as in production; --method overrides the former.
+import argparse
+import os
+import threading
+import time
+from benchmarks.common import use_temp_database, summarize, emit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--method', help='werkzeug hash method, e.g. pbkdf2:sha256:600000')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    use_temp_database()
+    if args.method:
+        os.environ['PASSWORD_HASH_METHOD'] = args.method
+
+    from app import app, db, init_db
+    from models import User
+    import passwords
+
+    with app.app_context():
+        init_db()
+        for i in range(args.users):
+            db.session.add(User(
+                username=f'bench{i}', email=f'bench{i}@example.com',
+                password=passwords.hash_password('secret'),
+                full_name=f'Bench {i}', role='farmer'
+            ))
+        db.session.commit()
+
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + args.duration
+
+    def worker(n):
+        client = app.test_client()
+        i = n
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.post('/api/users/login', json={
+                'username': f'bench{i % args.users}', 'password': 'secret'
+            })
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+            i += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    cores = min(passwords.PASSWORD_HASH_WORKERS, os.cpu_count() or 1) or 1
+    result = summarize(
+        'login', latencies, elapsed,
+        method=passwords.PASSWORD_HASH_METHOD,
+        hash_workers=passwords.PASSWORD_HASH_WORKERS,
+        threads=args.threads,
+        errors=len(errors)
+    )
+    result['rps_per_core'] = round(result['rps'] / cores, 2)
+    emit(result, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Hundreds of buyers ordering the same product at once. Checks that stock
+# never goes negative and exactly `stock` units are sold, and reports
+# orders per second.
+#
+#   cd backend && python -m benchmarks.oversell --stock 100 --orders 400 --threads 32
+import argparse
+import threading
+import time
+from benchmarks.common import use_temp_database, summarize, emit
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    use_temp_database()
+    from app import app, db, init_db
+    from models import User, Product, Order
+
+    with app.app_context():
+        init_db()
+        seller = User(username='seller', email='seller@example.com', full_name='Seller', role='farmer')
+        buyer = User(username='buyer', email='buyer@example.com', full_name='Buyer', role='producer')
+        db.session.add_all([seller, buyer])
+        db.session.commit()
+        product = Product(name='Buğday', price=10.0, quantity=args.stock, unit='kg',
+                          seller_id=seller.id, category_id=1)
+        db.session.add(product)
+        db.session.commit()
+        ids = {'product_id': product.id, 'seller_id': seller.id, 'buyer_id': buyer.id}
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    remaining = [args.orders]
+    barrier = threading.Barrier(args.threads)
+
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            response = client.post('/api/orders', json=dict(ids, quantity=1))
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        final_stock = db.session.get(Product, ids['product_id']).quantity
+        sold = db.session.query(db.func.coalesce(db.func.sum(Order.quantity), 0)).scalar()
+
+    created = statuses.get(201, 0)
+    result = summarize(
+        'oversell', latencies, elapsed,
+        threads=args.threads,
+        initial_stock=args.stock,
+        orders_created=created,
+        units_sold=sold,
+        final_stock=final_stock,
+        statuses={str(k): v for k, v in sorted(statuses.items())},
+        oversold=max(0, sold - args.stock),
+        consistent=final_stock == args.stock - sold and final_stock >= 0
+    )
+    result['orders_per_second'] = round(created / elapsed, 2) if elapsed else 0.0
+    emit(result, args.output)
+    if not result['consistent'] or result['oversold']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Worker boot time: what each gunicorn worker pays before it can serve,
+# measured in fresh interpreters. Reports importing app (which builds the
+# app through create_app) and import plus the first request; init-db runs
+# once per deploy and is timed separately.
+#
+#   cd backend && python -m benchmarks.startup --runs 10
+import argparse
+import os
+import subprocess
+import sys
+import time
+from benchmarks.common import use_temp_database, summarize, emit
+
+BOOT = '''
+import time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get('/api/categories')
+assert response.status_code == 200, response.status_code
+print(imported - start, time.perf_counter() - start)
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    use_temp_database()
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                   cwd=backend, check=True, capture_output=True)
+    init_seconds = time.perf_counter() - start
+
+    imports = []
+    first_requests = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', BOOT], cwd=backend, check=True,
+                                capture_output=True, text=True).stdout.split()
+        imports.append(float(output[0]))
+        first_requests.append(float(output[1]))
+
+    emit([
+        summarize('import_app', imports, sum(imports)),
+        summarize('first_request', first_requests, sum(first_requests),
+                  init_db_ms=round(init_seconds * 1000, 3))
+    ], args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+import csv
+import io
+import json
+import math
+from datetime import datetime
+from sqlalchemy import insert
+from models import db, Product, Category
+from geo import place, geohash
+from search import fold, index_rows
+from facets import record_products
+
+IMPORT_BATCH_SIZE = 500  # rows per INSERT round trip and commit
+MAX_IMPORT_ERRORS = 100  # reported one by one; further failures are only counted
+IMPORT_FORMATS = ('csv', 'ndjson')
+REQUIRED_COLUMNS = ('name', 'price', 'quantity')
+EXPORT_COLUMNS = ('id', 'name', 'description', 'price', 'quantity', 'unit', 'category',
+                  'location', 'harvest_date', 'created_at')
+
+
+class RowError(ValueError):
+    pass
+
+
+# The input can't be read any further (bad encoding, missing columns)
+class ImportFormatError(ValueError):
+    pass
+
+
+def import_format(requested, mimetype, filename=None):
+    if requested:
+        fmt = requested
+    elif filename and '.' in filename:
+        fmt = filename.rsplit('.', 1)[1].lower()
+        fmt = 'ndjson' if fmt in ('jsonl', 'json') else fmt
+    elif mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+        fmt = 'ndjson'
+    else:
+        fmt = 'csv'
+    if fmt not in IMPORT_FORMATS:
+        raise ImportFormatError(f"format must be one of: {', '.join(IMPORT_FORMATS)}")
+    return fmt
+
+
+# Yields (line number, record) from a binary stream as it is read, where a
+# record is a dict or a RowError for a line that could not be parsed
+def read_rows(stream, fmt):
+    if fmt == 'ndjson':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_number, RowError('Invalid JSON')
+                continue
+            yield line_number, record if isinstance(record, dict) else RowError('Expected a JSON object')
+        return
+
+    # utf-8-sig drops the byte order mark spreadsheet exports start with
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    try:
+        columns = [fold(column).strip() for column in reader.fieldnames or []]
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise ImportFormatError(f"Missing columns: {', '.join(missing)}")
+        reader.fieldnames = columns
+        for record in reader:
+            yield reader.line_num, record
+    except UnicodeDecodeError:
+        raise ImportFormatError('CSV must be UTF-8 encoded')
+    except csv.Error as e:
+        raise ImportFormatError(f'Unreadable CSV at line {reader.line_num}: {e}')
+
+
+def _text(value, field, max_length):
+    value = '' if value is None else str(value).strip()
+    if len(value) > max_length:
+        raise RowError(f'{field} is longer than {max_length} characters')
+    return value
+
+
+# Accepts "12,5" as well as "12.5", since Turkish spreadsheets export
+# decimal commas
+def _number(value, field):
+    if isinstance(value, str):
+        value = value.strip()
+        if ',' in value and '.' not in value:
+            value = value.replace(',', '.')
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{field} must be a number')
+    if not math.isfinite(number):
+        raise RowError(f'{field} must be a number')
+    return number
+
+
+# Category name (any case, with or without Turkish letters) to id. Loaded
+# once per process and reloaded at most once per import when a name or id
+# is not found, so categories added since are picked up.
+_categories = None
+
+
+class CategoryResolver:
+    def __init__(self):
+        self.reloaded = False
+
+    def _load(self):
+        global _categories
+        _categories = {fold(name).strip(): category_id
+                       for category_id, name in db.session.query(Category.id, Category.name)}
+        self.reloaded = True
+
+    def resolve(self, name, category_id):
+        if _categories is None:
+            self._load()
+        if name:
+            key = fold(str(name)).strip()
+            if key not in _categories and not self.reloaded:
+                self._load()
+            if key not in _categories:
+                raise RowError(f'Unknown category: {name}')
+            return _categories[key]
+        try:
+            category_id = int(category_id)
+        except (TypeError, ValueError):
+            raise RowError('category or category_id is required')
+        if category_id not in _categories.values() and not self.reloaded:
+            self._load()
+        if category_id not in _categories.values():
+            raise RowError(f'Unknown category_id: {category_id}')
+        return category_id
+
+
+# One record to a products row. Geocoding happens here because bulk inserts
+# don't fire the Product mapper events; _insert() covers the search index
+# and facet counts those events would otherwise maintain.
+def parse_product(record, seller_id, categories, now):
+    name = _text(record.get('name'), 'name', 120)
+    if not name:
+        raise RowError('name is required')
+    price = _number(record.get('price'), 'price')
+    if price <= 0:
+        raise RowError('price must be positive')
+    quantity = _number(record.get('quantity'), 'quantity')
+    if quantity < 0 or not quantity.is_integer():
+        raise RowError('quantity must be a non-negative integer')
+
+    harvest_date = None
+    if record.get('harvest_date'):
+        try:
+            harvest_date = datetime.fromisoformat(str(record['harvest_date']).strip())
+        except ValueError:
+            raise RowError('harvest_date must be an ISO date (YYYY-MM-DD)')
+
+    location = _text(record.get('location'), 'location', 255)
+    province, point = place(location)
+    return {
+        'name': name,
+        'description': _text(record.get('description'), 'description', 10000),
+        'price': price,
+        'quantity': int(quantity),
+        'unit': _text(record.get('unit'), 'unit', 50) or 'kg',
+        'seller_id': seller_id,
+        'category_id': categories.resolve(record.get('category'), record.get('category_id')),
+        'image_url': '',
+        'harvest_date': harvest_date,
+        'location': location,
+        'latitude': point[0] if point else None,
+        'longitude': point[1] if point else None,
+        'geohash': geohash(*point) if point else None,
+        'province': province,
+        'created_at': now,
+        'updated_at': now,
+        'is_active': True
+    }
+
+
+def _insert(rows):
+    product_ids = db.session.scalars(
+        insert(Product).returning(Product.id, sort_by_parameter_order=True), rows
+    ).all()
+    for row, product_id in zip(rows, product_ids):
+        row['id'] = product_id
+    index_rows(db.session.connection(), rows)
+    record_products(db.session.connection(), rows)
+    db.session.commit()
+
+
+# Validates records as they arrive and inserts the valid ones in batches of
+# IMPORT_BATCH_SIZE, each its own transaction, so memory and lock time stay
+# bounded whatever the file size. Invalid rows are skipped and reported by
+# line number. With dry_run nothing is written.
+def import_products(seller_id, records, dry_run=False):
+    summary = {'imported': 0, 'failed': 0, 'errors': []}
+    categories = CategoryResolver()
+    now = datetime.utcnow()
+    batch = []
+
+    def fail(line_number, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_IMPORT_ERRORS:
+            summary['errors'].append({'row': line_number, 'error': message})
+
+    try:
+        for line_number, record in records:
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                batch.append(parse_product(record, seller_id, categories, now))
+            except RowError as e:
+                fail(line_number, str(e))
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                if not dry_run:
+                    _insert(batch)
+                summary['imported'] += len(batch)
+                batch = []
+    except ImportFormatError as e:
+        summary['error'] = str(e)
+
+    if batch:
+        if not dry_run:
+            _insert(batch)
+        summary['imported'] += len(batch)
+    return summary
+
+
+# Active products of one seller with their category name, in id order;
+# stream with yield_per()
+def export_query(seller_id):
+    return db.session.query(
+        Product.id, Product.name, Product.description, Product.price, Product.quantity, Product.unit,
+        Category.name.label('category'), Product.location, Product.harvest_date, Product.created_at
+    ).outerjoin(Category, Category.id == Product.category_id).filter(
+        Product.seller_id == seller_id,
+        Product.is_active == True
+    ).order_by(Product.id)
+
+
+def export_row(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'description': row.description or '',
+        'price': row.price,
+        'quantity': row.quantity,
+        'unit': row.unit or '',
+        'category': row.category or '',
+        'location': row.location or '',
+        'harvest_date': row.harvest_date.date().isoformat() if row.harvest_date else '',
+        'created_at': row.created_at.isoformat() if row.created_at else ''
+    }
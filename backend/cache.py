@@ -0,0 +1,153 @@
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, Response
+
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 2048))
+CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 60))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', '')
+
+
+# In-process LRU with per-entry expiry. Each gunicorn worker has its own
+# copy, so invalidation only reaches the worker that handled the write;
+# other workers serve stale entries for at most the TTL (never for views
+# behind @conditional, see cached()).
+class MemoryBackend:
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Kept apart from the LRU so an evicted generation can't reset to 0
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared cache for multi-worker deployments; any Redis-protocol server works
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._redis.get(key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, pickle.dumps(value), ex=ttl)
+
+    def counter(self, key):
+        return int(self._redis.get(key) or 0)
+
+    def incr(self, key):
+        return self._redis.incr(key)
+
+    def clear(self):
+        self._redis.flushdb()
+
+
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+
+    # Bumping a namespace generation orphans every key built from the old
+    # one, which is cheaper than finding and deleting them
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.incr(f'gen:{namespace}')
+
+    def make_key(self, namespace, endpoint, args, version=None):
+        normalized = json.dumps(sorted((k, sorted(args.getlist(k))) for k in args), separators=(',', ':'))
+        key = f"{namespace}:{self.backend.counter(f'gen:{namespace}')}:{endpoint}:{normalized}"
+        return f'{key}:{version}' if version else key
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=CACHE_DEFAULT_TTL):
+        self.backend.set(key, value, ttl)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def _create_backend():
+    if CACHE_REDIS_URL:
+        return RedisBackend(CACHE_REDIS_URL)
+    return MemoryBackend()
+
+
+response_cache = ResponseCache(_create_backend())
+
+
+# Caches successful GET responses keyed on endpoint, view arguments and the
+# normalized query string. Writes call response_cache.invalidate(namespace).
+# Under @conditional the key also carries the current ETag, so a write
+# handled by another worker can't leave this one serving the old body under
+# the new tag: the version query misses the stale entry instead.
+def cached(namespace, ttl=CACHE_DEFAULT_TTL):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            endpoint = request.endpoint + ''.join(f':{k}={v}' for k, v in sorted(kwargs.items()))
+            key = response_cache.make_key(namespace, endpoint, request.args, g.get('response_version'))
+            entry = response_cache.get(key)
+            if entry is not None:
+                body, status, headers = entry
+                return Response(body, status=status, headers=headers)
+
+            response = view(*args, **kwargs)
+            if isinstance(response, tuple):
+                return response
+            if response.status_code == 200 and not response.is_streamed:
+                headers = [(k, v) for k, v in response.headers.items() if k != 'Content-Length']
+                response_cache.set(key, (response.get_data(), response.status_code, headers), ttl)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,38 @@
+import hashlib
+from functools import wraps
+from flask import g, request, Response
+
+
+def make_etag(version):
+    args = sorted((k, sorted(request.args.getlist(k))) for k in request.args)
+    raw = repr((request.path, args, version)).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+# Answers GETs with 304 Not Modified when the client's If-None-Match still
+# matches. `version` receives the view arguments and returns a small value
+# that changes whenever the response body would (row counts, max(updated_at)),
+# so a match is detected without loading or serializing any rows. Returning
+# None skips the check and lets the view answer (e.g. with a 404).
+def conditional(version, cache_control):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = version(*args, **kwargs)
+            if current is None:
+                return view(*args, **kwargs)
+
+            etag = make_etag(current)
+            # Read by @cached, which keys its entries on it
+            g.response_version = etag
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = view(*args, **kwargs)
+                if isinstance(response, tuple) or response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+import os
+import random
+import sqlite3
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per gunicorn worker: each worker process gets its own pool
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # seconds, below typical server idle timeouts
+
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # ms
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+
+# Comma separated; GET requests are spread over these
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# How long a client keeps reading from the primary after a write, so it sees
+# its own changes even while the replicas lag behind
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+STICKY_COOKIE = 'db_primary'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+# Heroku/Render/Railway hand out postgres:// URLs, which SQLAlchemy 2 no
+# longer accepts
+def normalize_url(url):
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def database_url(default):
+    return normalize_url(os.getenv('DATABASE_URL', default))
+
+
+def engine_options(url):
+    if url.startswith('sqlite'):
+        # SQLite connections are cheap and the file lock is the limit, so the
+        # default pool is kept; the pragmas below do the tuning
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        # Replaces connections the server closed (restarts, idle timeouts)
+        # instead of failing the request that picks them up
+        'pool_pre_ping': True
+    }
+
+
+# WAL lets readers run alongside the single writer instead of blocking on
+# it, busy_timeout makes a writer wait for the lock rather than fail with
+# "database is locked", and synchronous=NORMAL is durable in WAL mode while
+# skipping an fsync per commit
+@event.listens_for(Engine, 'connect')
+def configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+    cursor.execute(f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}')
+    cursor.close()
+
+
+# SQLALCHEMY_BINDS entries for the replicas; models keep the default bind and
+# RoutingSession decides per request which engine serves them
+def replica_binds():
+    binds = {}
+    for index, url in enumerate(DATABASE_REPLICA_URLS):
+        url = normalize_url(url)
+        binds[f'replica_{index}'] = {'url': url, **engine_options(url)}
+    return binds
+
+
+# Sends reads to the replica picked for the request and everything else to
+# the primary. Once the session has flushed or run an INSERT/UPDATE/DELETE it
+# stays on the primary, so later reads in the same request see the write.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get('primary'):
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['primary'] = True
+            elif has_request_context() and g.get('read_replica'):
+                return self._db.engines[g.read_replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_replica_routing(app):
+    if not DATABASE_REPLICA_URLS:
+        return
+
+    @app.before_request
+    def choose_replica():
+        g.read_replica = None
+        if request.method in READ_METHODS and STICKY_COOKIE not in request.cookies:
+            g.read_replica = f'replica_{random.randrange(len(DATABASE_REPLICA_URLS))}'
+
+    # Successful writes pin the client to the primary for a short window
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=REPLICA_STICKY_SECONDS,
+                                httponly=True, secure=True, samesite='None')
+        return response
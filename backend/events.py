@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+
+EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL', '')
+EVENTS_REDIS_KEY = os.getenv('EVENTS_REDIS_KEY', 'tarim:order-events')
+EVENTS_BUFFER_SIZE = int(os.getenv('EVENTS_BUFFER_SIZE', 1000))  # events kept for Last-Event-ID resume
+EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+# Streams end after this long and the browser reconnects with Last-Event-ID,
+# so a connection never holds a worker thread indefinitely
+EVENTS_MAX_STREAM_SECONDS = int(os.getenv('EVENTS_MAX_STREAM_SECONDS', 300))
+EVENTS_RETRY_MS = int(os.getenv('EVENTS_RETRY_MS', 3000))
+# Open streams per worker process; 0 = no cap. Under the threaded workers
+# each one holds a request thread for up to EVENTS_MAX_STREAM_SECONDS, so
+# keep this below gunicorn's --threads to leave threads for everything
+# else; gunicorn.conf.py derives it from the thread count. Raise it when
+# running with -k gevent, where a stream is a greenlet.
+EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', 4))
+
+
+# Ring buffer of recent events in this process. Event ids carry a per-process
+# token, so an id from another worker (or from before a restart) is detected
+# and the client is told to refetch instead of silently missing events.
+class MemoryBroker:
+    def __init__(self, size=EVENTS_BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._seq = 0
+        self._instance = uuid.uuid4().hex[:8]
+        self._changed = threading.Condition()
+        self.published = 0
+
+    def publish(self, users, event, data):
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+        with self._changed:
+            self._seq += 1
+            self._events.append((self._seq, frozenset(users), event, payload))
+            self.published += 1
+            self._changed.notify_all()
+
+    # (cursor, missed): where to read from, and whether events between
+    # last_id and now can no longer be delivered
+    def start(self, last_id):
+        with self._changed:
+            head = self._seq
+            oldest = self._events[0][0] if self._events else head + 1
+        if not last_id:
+            return head, False
+        instance, _, seq = last_id.partition('-')
+        if instance != self._instance or not seq.isdigit() or int(seq) > head:
+            return head, True
+        seq = int(seq)
+        return (head, True) if seq < oldest - 1 else (seq, False)
+
+    # Blocks up to timeout for events after cursor addressed to user_id.
+    # Returns the new cursor and [(id, event, data)].
+    def read(self, user_id, cursor, timeout):
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self._seq <= cursor:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return cursor, []
+                self._changed.wait(remaining)
+            head = self._seq
+            first = head - len(self._events) + 1
+            pending = islice(self._events, max(cursor + 1 - first, 0), None)
+            events = [(f'{self._instance}-{seq}', event, payload)
+                      for seq, users, event, payload in pending if user_id in users]
+        return head, events
+
+    def cursor_id(self, cursor):
+        return f'{self._instance}-{cursor}'
+
+
+# Redis Streams, shared by every worker: XADD on publish, blocking XREAD per
+# connected client. Stream entry ids double as SSE event ids.
+class RedisBroker:
+    def __init__(self, url, key=EVENTS_REDIS_KEY, size=EVENTS_BUFFER_SIZE):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.key = key
+        self.size = size
+        self.published = 0
+
+    def publish(self, users, event, data):
+        self._redis.xadd(self.key, {
+            'users': ','.join(str(user) for user in users),
+            'event': event,
+            'data': json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+        }, maxlen=self.size, approximate=True)
+        self.published += 1
+
+    def start(self, last_id):
+        newest = self._redis.xrevrange(self.key, count=1)
+        head = newest[0][0] if newest else '0-0'
+        if not last_id:
+            return head, False
+        try:
+            position = _stream_id(last_id)
+        except ValueError:
+            return head, True
+        if position > _stream_id(head):
+            return head, True
+        # The stream is only trimmed once it is full, so an id older than the
+        # first entry of a full stream may have lost events in between
+        oldest = self._redis.xrange(self.key, count=1)
+        if oldest and position < _stream_id(oldest[0][0]) and self._redis.xlen(self.key) >= self.size:
+            return head, True
+        return last_id, False
+
+    def read(self, user_id, cursor, timeout):
+        response = self._redis.xread({self.key: cursor}, count=500, block=max(int(timeout * 1000), 1))
+        events = []
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                cursor = entry_id
+                if str(user_id) in fields.get('users', '').split(','):
+                    events.append((entry_id, fields['event'], fields['data']))
+        return cursor, events
+
+    def cursor_id(self, cursor):
+        return cursor
+
+
+def _stream_id(value):
+    milliseconds, _, sequence = value.partition('-')
+    return int(milliseconds), int(sequence or 0)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+_streams_open = 0
+
+
+# Created on first use rather than at import, so under gunicorn --preload the
+# Condition is made in the worker (after gevent has patched threading, when
+# running with -k gevent) instead of in the master
+def broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = RedisBroker(EVENTS_REDIS_URL) if EVENTS_REDIS_URL else MemoryBroker()
+    return _broker
+
+
+# Notifies the buyer and the seller of an order. Call after the commit; a
+# failing Redis only loses the live update, not the write.
+def publish_order_event(event, order):
+    users = {order['buyer_id'], order['seller_id']}
+    try:
+        broker().publish(users, event, order)
+    except Exception as e:
+        print(f'Failed to publish {event} for order {order.get("id")}: {e}')
+
+
+def _message(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'
+
+
+# SSE body for one client: every order event addressed to user_id after
+# last_id, a comment line every heartbeat so proxies keep the connection
+# open, and a `reset` event when events were missed (buffer overrun, other
+# worker, restart) so the client refetches GET /api/orders. Heartbeats carry
+# the current cursor as the id, which moves the browser's Last-Event-ID past
+# other users' events without dispatching anything.
+def order_stream(user_id, last_id):
+    source = broker()
+    cursor, missed = source.start(last_id)
+    deadline = time.monotonic() + EVENTS_MAX_STREAM_SECONDS
+    yield f'retry: {EVENTS_RETRY_MS}\nid: {source.cursor_id(cursor)}\n\n'
+    if missed:
+        yield _message(source.cursor_id(cursor), 'reset', '{}')
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        cursor, events = source.read(user_id, cursor, min(EVENTS_HEARTBEAT_SECONDS, remaining))
+        if events:
+            yield ''.join(_message(*event) for event in events)
+        else:
+            yield f': keepalive\nid: {source.cursor_id(cursor)}\n\n'
+
+
+# Claims a stream slot, or returns False when EVENTS_MAX_STREAMS are open.
+# Pair with close_stream() through Response.call_on_close, which also runs
+# when the client leaves before the generator has started.
+def open_stream():
+    global _streams_open
+    with _broker_lock:
+        if EVENTS_MAX_STREAMS and _streams_open >= EVENTS_MAX_STREAMS:
+            return False
+        _streams_open += 1
+        return True
+
+
+def close_stream():
+    global _streams_open
+    with _broker_lock:
+        _streams_open -= 1
+
+
+def streams_open():
+    return _streams_open
+
+
+def stats():
+    return {
+        'backend': type(broker()).__name__,
+        'streams_open': _streams_open,
+        'max_streams': EVENTS_MAX_STREAMS,
+        'published': broker().published
+    }
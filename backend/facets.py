@@ -0,0 +1,244 @@
+from bisect import bisect_right
+from sqlalchemy import String, case, cast, delete, event, func, inspect, insert, literal, select, update
+from models import db, Product, Category, Order, CategoryStats, CategoryFacetStats
+from stats import increment
+from search import apply_search
+from geo import apply_near
+
+PRICE_BUCKETS = (0, 10, 25, 50, 100, 250, 500, 1000, 2500)  # lower bounds, TL
+FACET_TOP_LOCATIONS = 10
+# Product attributes the facet counts depend on, in _values() order
+FACET_ATTRIBUTES = ('is_active', 'category_id', 'price', 'province', 'unit')
+
+
+def price_bucket(price):
+    return PRICE_BUCKETS[max(bisect_right(PRICE_BUCKETS, price or 0) - 1, 0)]
+
+
+# SQL counterpart of price_bucket()
+def _price_bucket_column():
+    return case(*((Product.price >= bound, bound) for bound in reversed(PRICE_BUCKETS[1:])),
+                else_=PRICE_BUCKETS[0])
+
+
+def _facet_values(price, province, unit):
+    values = [('price', str(price_bucket(price)))]
+    if province:
+        values.append(('location', province))
+    if unit:
+        values.append(('unit', unit))
+    return values
+
+
+def _apply(connection, values, sign):
+    is_active, category_id, price, province, unit = values
+    if is_active is False or category_id is None:
+        return
+    increment(CategoryStats, {'category_id': category_id}, {'product_count': sign}, connection)
+    for facet, value in _facet_values(price, province, unit):
+        increment(CategoryFacetStats, {'category_id': category_id, 'facet': facet, 'value': value},
+                  {'product_count': sign}, connection)
+
+
+# MIN/MAX can't be maintained by adding deltas once a product leaves a
+# category, so they are re-read; each is one probe of
+# ix_products_active_category_price
+def _refresh_prices(connection, category_ids):
+    for category_id in category_ids:
+        if category_id is None:
+            continue
+        active = (Product.is_active == True, Product.category_id == category_id)
+        connection.execute(update(CategoryStats).where(CategoryStats.category_id == category_id).values(
+            min_price=select(func.min(Product.price)).where(*active).scalar_subquery(),
+            max_price=select(func.max(Product.price)).where(*active).scalar_subquery()
+        ))
+
+
+def _values(product, previous=False):
+    state = inspect(product)
+    values = []
+    for name in FACET_ATTRIBUTES:
+        history = state.attrs[name].history
+        values.append(history.deleted[0] if previous and history.deleted else getattr(product, name))
+    return tuple(values)
+
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, product):
+    values = _values(product)
+    _apply(connection, values, 1)
+    _refresh_prices(connection, {values[1]})
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, product):
+    old, new = _values(product, previous=True), _values(product)
+    # Stock changes from orders and text edits don't move any count
+    if old == new:
+        return
+    _apply(connection, old, -1)
+    _apply(connection, new, 1)
+    _refresh_prices(connection, {old[1], new[1]})
+
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, product):
+    values = _values(product, previous=True)
+    _apply(connection, values, -1)
+    _refresh_prices(connection, {values[1]})
+
+
+# For bulk inserts, which bypass the mapper events above: rows are the
+# inserted dicts. One upsert per distinct (category, facet, value).
+def record_products(connection, rows):
+    counts = {}
+    for row in rows:
+        keys = [(row['category_id'], None, None)]
+        keys += [(row['category_id'], facet, value)
+                 for facet, value in _facet_values(row['price'], row.get('province'), row.get('unit'))]
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+    for (category_id, facet, value), count in counts.items():
+        if facet is None:
+            increment(CategoryStats, {'category_id': category_id}, {'product_count': count}, connection)
+        else:
+            increment(CategoryFacetStats, {'category_id': category_id, 'facet': facet, 'value': value},
+                      {'product_count': count}, connection)
+    _refresh_prices(connection, {row['category_id'] for row in rows})
+
+
+# Call before committing a new order
+def record_category_order(category_id, quantity, total_price):
+    increment(CategoryStats, {'category_id': category_id},
+              {'order_count': 1, 'units_sold': quantity, 'revenue': total_price})
+
+
+# Fills the summary tables from products and orders when they are empty
+# (e.g. right after they were added to an existing database), or recomputes
+# them with rebuild=True after writes that bypassed the ORM
+def ensure_category_stats(engine, rebuild=False):
+    with engine.begin() as connection:
+        if rebuild:
+            connection.execute(delete(CategoryFacetStats))
+            connection.execute(delete(CategoryStats))
+        elif connection.execute(select(func.count()).select_from(CategoryStats)).scalar():
+            return
+
+        active = Product.is_active == True
+        products = select(
+            Product.category_id, func.count(Product.id).label('product_count'),
+            func.min(Product.price).label('min_price'), func.max(Product.price).label('max_price')
+        ).where(active).group_by(Product.category_id).subquery()
+        orders = select(
+            Product.category_id, func.count(Order.id).label('order_count'),
+            func.sum(Order.quantity).label('units_sold'), func.sum(Order.total_price).label('revenue')
+        ).join(Product, Product.id == Order.product_id).group_by(Product.category_id).subquery()
+        connection.execute(insert(CategoryStats).from_select(
+            ['category_id', 'product_count', 'min_price', 'max_price', 'order_count', 'units_sold', 'revenue'],
+            select(Category.id, func.coalesce(products.c.product_count, 0), products.c.min_price,
+                   products.c.max_price, func.coalesce(orders.c.order_count, 0),
+                   func.coalesce(orders.c.units_sold, 0), func.coalesce(orders.c.revenue, 0.0))
+            .select_from(Category)
+            .outerjoin(products, products.c.category_id == Category.id)
+            .outerjoin(orders, orders.c.category_id == Category.id)
+        ))
+
+        for facet, column in (('price', cast(_price_bucket_column(), String)),
+                              ('location', Product.province), ('unit', Product.unit)):
+            connection.execute(insert(CategoryFacetStats).from_select(
+                ['category_id', 'facet', 'value', 'product_count'],
+                select(Product.category_id, literal(facet), column, func.count(Product.id))
+                .where(active, column.isnot(None), column != '')
+                .group_by(Product.category_id, column)
+            ))
+
+
+# counts: {category_id: (count, min_price, max_price)}, or None to use the
+# summary table's
+def _categories(counts=None):
+    stats = {row.category_id: row for row in CategoryStats.query}
+    if counts is None:
+        counts = {category_id: (row.product_count, row.min_price, row.max_price)
+                  for category_id, row in stats.items()}
+    categories = []
+    for category in Category.query.order_by(Category.id):
+        count, min_price, max_price = counts.get(category.id, (0, None, None))
+        row = stats.get(category.id)
+        categories.append({
+            'category_id': category.id,
+            'name': category.name,
+            'count': count,
+            'min_price': min_price,
+            'max_price': max_price,
+            'order_count': row.order_count if row else 0,
+            'units_sold': row.units_sold if row else 0
+        })
+    return categories
+
+
+def _result(categories, buckets, locations, units, top):
+    price = [{'min': bound, 'max': upper, 'count': buckets.get(bound, 0)}
+             for bound, upper in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + (None,))]
+    return {
+        'total': sum(buckets.values()),
+        'categories': categories,
+        'price': price,
+        'locations': [{'province': name, 'count': count}
+                      for name, count in sorted(locations.items(), key=lambda item: (-item[1], item[0]))[:top]],
+        'units': [{'unit': name, 'count': count}
+                  for name, count in sorted(units.items(), key=lambda item: (-item[1], item[0]))]
+    }
+
+
+# From the summary tables: cost depends on the number of categories and
+# facet values, not on the catalog size
+def _summary_facets(category_id, top):
+    query = db.session.query(
+        CategoryFacetStats.facet, CategoryFacetStats.value, func.sum(CategoryFacetStats.product_count)
+    ).filter(CategoryFacetStats.product_count > 0)
+    if category_id:
+        query = query.filter(CategoryFacetStats.category_id == category_id)
+    facets = {'price': {}, 'location': {}, 'unit': {}}
+    for facet, value, count in query.group_by(CategoryFacetStats.facet, CategoryFacetStats.value):
+        if count:
+            facets[facet][int(value) if facet == 'price' else value] = count
+    return _result(_categories(), facets['price'], facets['location'], facets['unit'], top)
+
+
+# Grouped SQL over the matching products, for filters the summary tables
+# don't cover (seller, search, near)
+def _query_facets(category_id, seller_id, search, near, top):
+    def matching(query, by_category=True):
+        query = query.filter(Product.is_active == True)
+        if by_category and category_id:
+            query = query.filter(Product.category_id == category_id)
+        if seller_id:
+            query = query.filter(Product.seller_id == seller_id)
+        if search:
+            query, _ = apply_search(query, search)
+        if near:
+            query, _ = apply_near(query, *near)
+        return query
+
+    # The category facet ignores the category filter, so the counts show
+    # what switching category would give
+    counts = {category: (count, min_price, max_price) for category, count, min_price, max_price in matching(
+        db.session.query(Product.category_id, func.count(Product.id), func.min(Product.price), func.max(Product.price)),
+        by_category=False
+    ).group_by(Product.category_id)}
+
+    bucket = _price_bucket_column()
+    buckets = dict(matching(db.session.query(bucket, func.count(Product.id))).group_by(bucket).all())
+    locations = dict(matching(db.session.query(Product.province, func.count(Product.id)))
+                     .filter(Product.province.isnot(None)).group_by(Product.province).all())
+    units = dict(matching(db.session.query(Product.unit, func.count(Product.id)))
+                 .filter(Product.unit.isnot(None), Product.unit != '').group_by(Product.unit).all())
+    return _result(_categories(counts), buckets, locations, units, top)
+
+
+# Facet counts over active products for the listing filters of
+# GET /api/products: category, price bucket, province and unit
+def product_facets(category_id=None, seller_id=None, search=None, near=None, top=FACET_TOP_LOCATIONS):
+    if not seller_id and not search and not near:
+        return _summary_facets(category_id, top)
+    return _query_facets(category_id, seller_id, search, near, top)
@@ -0,0 +1,291 @@
+import math
+from sqlalchemy import and_, event, inspect, or_, text
+from models import Product
+from search import fold, tokens
+
+# Province centres (city centre of the provincial capital), latitude and
+# longitude in degrees
+PROVINCES = {
+    'Adana': (37.00, 35.32), 'Adıyaman': (37.76, 38.28), 'Afyonkarahisar': (38.76, 30.54),
+    'Ağrı': (39.72, 43.05), 'Aksaray': (38.37, 34.03), 'Amasya': (40.65, 35.83),
+    'Ankara': (39.93, 32.86), 'Antalya': (36.89, 30.70), 'Ardahan': (41.11, 42.70),
+    'Artvin': (41.18, 41.82), 'Aydın': (37.85, 27.84), 'Balıkesir': (39.65, 27.88),
+    'Bartın': (41.64, 32.34), 'Batman': (37.89, 41.13), 'Bayburt': (40.26, 40.23),
+    'Bilecik': (40.14, 29.98), 'Bingöl': (38.88, 40.50), 'Bitlis': (38.40, 42.11),
+    'Bolu': (40.74, 31.61), 'Burdur': (37.72, 30.29), 'Bursa': (40.19, 29.06),
+    'Çanakkale': (40.15, 26.41), 'Çankırı': (40.60, 33.61), 'Çorum': (40.55, 34.95),
+    'Denizli': (37.78, 29.09), 'Diyarbakır': (37.91, 40.24), 'Düzce': (40.84, 31.16),
+    'Edirne': (41.68, 26.56), 'Elazığ': (38.68, 39.22), 'Erzincan': (39.75, 39.49),
+    'Erzurum': (39.90, 41.27), 'Eskişehir': (39.78, 30.52), 'Gaziantep': (37.07, 37.38),
+    'Giresun': (40.91, 38.39), 'Gümüşhane': (40.46, 39.48), 'Hakkari': (37.58, 43.74),
+    'Hatay': (36.20, 36.16), 'Iğdır': (39.92, 44.04), 'Isparta': (37.76, 30.55),
+    'İstanbul': (41.01, 28.98), 'İzmir': (38.42, 27.14), 'Kahramanmaraş': (37.58, 36.94),
+    'Karabük': (41.20, 32.62), 'Karaman': (37.18, 33.22), 'Kars': (40.60, 43.10),
+    'Kastamonu': (41.38, 33.78), 'Kayseri': (38.72, 35.49), 'Kırıkkale': (39.85, 33.51),
+    'Kırklareli': (41.73, 27.22), 'Kırşehir': (39.15, 34.16), 'Kilis': (36.72, 37.12),
+    'Kocaeli': (40.77, 29.92), 'Konya': (37.87, 32.48), 'Kütahya': (39.42, 29.98),
+    'Malatya': (38.35, 38.31), 'Manisa': (38.61, 27.43), 'Mardin': (37.31, 40.74),
+    'Mersin': (36.81, 34.64), 'Muğla': (37.22, 28.36), 'Muş': (38.74, 41.51),
+    'Nevşehir': (38.62, 34.71), 'Niğde': (37.97, 34.68), 'Ordu': (40.98, 37.88),
+    'Osmaniye': (37.07, 36.25), 'Rize': (41.02, 40.52), 'Sakarya': (40.78, 30.40),
+    'Samsun': (41.29, 36.33), 'Siirt': (37.93, 41.94), 'Sinop': (42.03, 35.15),
+    'Sivas': (39.75, 37.02), 'Şanlıurfa': (37.16, 38.79), 'Şırnak': (37.52, 42.46),
+    'Tekirdağ': (40.98, 27.51), 'Tokat': (40.31, 36.55), 'Trabzon': (41.00, 39.72),
+    'Tunceli': (39.11, 39.55), 'Uşak': (38.68, 29.41), 'Van': (38.49, 43.38),
+    'Yalova': (40.65, 29.27), 'Yozgat': (39.82, 34.81), 'Zonguldak': (41.45, 31.79)
+}
+
+# Common short or old names
+PROVINCE_ALIASES = {
+    'Afyon': 'Afyonkarahisar', 'Maraş': 'Kahramanmaraş', 'Urfa': 'Şanlıurfa', 'Antep': 'Gaziantep',
+    'İçel': 'Mersin', 'Adapazarı': 'Sakarya', 'İzmit': 'Kocaeli', 'Antakya': 'Hatay'
+}
+
+# Larger agricultural districts, so listings in them are not placed at the
+# provincial capital (which can be 100+ km away)
+DISTRICTS = {
+    ('Adana', 'Ceyhan'): (37.03, 35.82), ('Adana', 'Kozan'): (37.45, 35.82),
+    ('Afyonkarahisar', 'Bolvadin'): (38.71, 31.05), ('Afyonkarahisar', 'Sandıklı'): (38.47, 30.27),
+    ('Amasya', 'Merzifon'): (40.87, 35.46), ('Amasya', 'Suluova'): (40.83, 35.65),
+    ('Ankara', 'Beypazarı'): (40.17, 31.92), ('Ankara', 'Haymana'): (39.43, 32.50),
+    ('Ankara', 'Polatlı'): (39.58, 32.15), ('Antalya', 'Alanya'): (36.54, 31.99),
+    ('Antalya', 'Kaş'): (36.20, 29.64), ('Antalya', 'Kumluca'): (36.37, 30.29),
+    ('Antalya', 'Manavgat'): (36.79, 31.44), ('Antalya', 'Serik'): (36.92, 31.10),
+    ('Aydın', 'Nazilli'): (37.91, 28.32), ('Aydın', 'Söke'): (37.75, 27.41),
+    ('Balıkesir', 'Ayvalık'): (39.32, 26.69), ('Balıkesir', 'Bandırma'): (40.35, 27.97),
+    ('Balıkesir', 'Edremit'): (39.60, 27.02), ('Bursa', 'İnegöl'): (40.08, 29.51),
+    ('Bursa', 'Mustafakemalpaşa'): (40.04, 28.41), ('Çanakkale', 'Biga'): (40.23, 27.24),
+    ('Çanakkale', 'Ezine'): (39.79, 26.34), ('Çorum', 'Sungurlu'): (40.17, 34.37),
+    ('Denizli', 'Çivril'): (38.30, 29.74), ('Diyarbakır', 'Bismil'): (37.85, 40.66),
+    ('Düzce', 'Akçakoca'): (41.09, 31.12), ('Edirne', 'Keşan'): (40.86, 26.63),
+    ('Edirne', 'Uzunköprü'): (41.27, 26.69), ('Eskişehir', 'Sivrihisar'): (39.45, 31.54),
+    ('Gaziantep', 'İslahiye'): (37.03, 36.63), ('Gaziantep', 'Nizip'): (37.01, 37.79),
+    ('Giresun', 'Bulancak'): (40.94, 38.23), ('Hatay', 'İskenderun'): (36.59, 36.17),
+    ('Hatay', 'Reyhanlı'): (36.27, 36.57), ('Isparta', 'Eğirdir'): (37.87, 30.85),
+    ('Isparta', 'Yalvaç'): (38.30, 31.18), ('İstanbul', 'Çatalca'): (41.14, 28.46),
+    ('İstanbul', 'Silivri'): (41.07, 28.25), ('İstanbul', 'Şile'): (41.18, 29.61),
+    ('İzmir', 'Bergama'): (39.12, 27.18), ('İzmir', 'Ödemiş'): (38.23, 27.97),
+    ('İzmir', 'Tire'): (38.09, 27.73), ('İzmir', 'Torbalı'): (38.16, 27.36),
+    ('Kahramanmaraş', 'Elbistan'): (38.21, 37.20), ('Karaman', 'Ermenek'): (36.64, 32.89),
+    ('Kars', 'Sarıkamış'): (40.33, 42.59), ('Kayseri', 'Develi'): (38.39, 35.49),
+    ('Kırklareli', 'Babaeski'): (41.43, 27.09), ('Kırklareli', 'Lüleburgaz'): (41.40, 27.36),
+    ('Kocaeli', 'Gebze'): (40.80, 29.43), ('Konya', 'Akşehir'): (38.36, 31.42),
+    ('Konya', 'Beyşehir'): (37.68, 31.72), ('Konya', 'Cihanbeyli'): (38.66, 32.92),
+    ('Konya', 'Çumra'): (37.57, 32.77), ('Konya', 'Ereğli'): (37.51, 34.05),
+    ('Konya', 'Karapınar'): (37.72, 33.55), ('Manisa', 'Akhisar'): (38.92, 27.84),
+    ('Manisa', 'Alaşehir'): (38.35, 28.52), ('Manisa', 'Salihli'): (38.48, 28.14),
+    ('Manisa', 'Turgutlu'): (38.50, 27.70), ('Mardin', 'Kızıltepe'): (37.19, 40.59),
+    ('Mersin', 'Erdemli'): (36.61, 34.31), ('Mersin', 'Silifke'): (36.38, 33.93),
+    ('Mersin', 'Tarsus'): (36.92, 34.89), ('Muğla', 'Bodrum'): (37.04, 27.43),
+    ('Muğla', 'Fethiye'): (36.62, 29.12), ('Muğla', 'Milas'): (37.32, 27.78),
+    ('Nevşehir', 'Ürgüp'): (38.63, 34.91), ('Niğde', 'Bor'): (37.89, 34.56),
+    ('Ordu', 'Fatsa'): (41.03, 37.50), ('Ordu', 'Ünye'): (41.13, 37.29),
+    ('Osmaniye', 'Kadirli'): (37.37, 36.10), ('Rize', 'Ardeşen'): (41.19, 41.00),
+    ('Rize', 'Çayeli'): (41.09, 40.73), ('Sakarya', 'Akyazı'): (40.68, 30.62),
+    ('Sakarya', 'Hendek'): (40.80, 30.75), ('Samsun', 'Bafra'): (41.57, 35.91),
+    ('Samsun', 'Çarşamba'): (41.20, 36.72), ('Samsun', 'Terme'): (41.21, 36.97),
+    ('Sivas', 'Şarkışla'): (39.35, 36.41), ('Şanlıurfa', 'Ceylanpınar'): (36.85, 40.05),
+    ('Şanlıurfa', 'Harran'): (36.86, 39.03), ('Şanlıurfa', 'Siverek'): (37.75, 39.32),
+    ('Şanlıurfa', 'Viranşehir'): (37.23, 39.76), ('Tekirdağ', 'Çorlu'): (41.16, 27.80),
+    ('Tekirdağ', 'Malkara'): (40.89, 26.90), ('Tokat', 'Erbaa'): (40.67, 36.57),
+    ('Tokat', 'Niksar'): (40.59, 36.95), ('Tokat', 'Turhal'): (40.39, 36.08),
+    ('Trabzon', 'Akçaabat'): (41.02, 39.57), ('Van', 'Erciş'): (39.03, 43.36),
+    ('Zonguldak', 'Ereğli'): (41.28, 31.42)
+}
+
+# Folded lookups: 'sanliurfa' -> 'Şanlıurfa', 'eregli' -> [('Konya', 'Ereğli'), ...]
+_provinces = {fold(name): name for name in PROVINCES}
+_provinces.update({fold(alias): name for alias, name in PROVINCE_ALIASES.items()})
+_districts = {}
+for _province, _district in DISTRICTS:
+    _districts.setdefault(fold(_district), []).append((_province, _district))
+
+GEOHASH_PRECISION = 7  # ~150 m cells
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+KM_PER_DEGREE = 111.195
+MAX_RADIUS_KM = 2000
+DEFAULT_RADIUS_KM = 50
+
+
+class NearError(ValueError):
+    pass
+
+
+# (province, (latitude, longitude)) for free-text locations such as
+# "Ereğli, Konya", "Polatlı / ANKARA" or "urfa"; (None, None) when no known
+# place is named. A district wins over its province; a district name shared
+# by several provinces needs the province to be named as well.
+def place(location):
+    words = tokens(location)
+    if not words:
+        return None, None
+    province = next((_provinces[word] for word in words if word in _provinces), None)
+    for word in words:
+        candidates = _districts.get(word, [])
+        if province:
+            candidates = [c for c in candidates if c[0] == province]
+        if len(candidates) == 1:
+            return candidates[0][0], DISTRICTS[candidates[0]]
+    return (province, PROVINCES[province]) if province else (None, None)
+
+
+def geocode(location):
+    return place(location)[1]
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def _cell_size(precision):
+    lat_bits = precision * 5 // 2
+    lon_bits = precision * 5 - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+# Geohash prefixes whose cells cover every point within radius_km of the
+# centre: the finest precision whose cells are at least radius_km across,
+# taken for the centre cell and its eight neighbours. None when the radius
+# is wider than the coarsest useful cells.
+def covering_prefixes(latitude, longitude, radius_km):
+    lat_radius = radius_km / KM_PER_DEGREE
+    lon_radius = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    for precision in range(GEOHASH_PRECISION, 1, -1):
+        cell_height, cell_width = _cell_size(precision)
+        if cell_height >= lat_radius and cell_width >= lon_radius:
+            return sorted({
+                geohash(max(-90.0, min(90.0, latitude + dy * cell_height)),
+                        max(-180.0, min(180.0, longitude + dx * cell_width)), precision)
+                for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+            })
+    return None
+
+
+def parse_near(raw_near, raw_radius):
+    try:
+        latitude, longitude = (float(part) for part in raw_near.split(','))
+    except ValueError:
+        raise NearError('near must be "latitude,longitude"')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise NearError('near is out of range')
+    try:
+        radius = float(raw_radius) if raw_radius else DEFAULT_RADIUS_KM
+    except ValueError:
+        raise NearError('radius_km must be a number')
+    if not 0 < radius <= MAX_RADIUS_KM:
+        raise NearError(f'radius_km must be between 0 and {MAX_RADIUS_KM}')
+    return latitude, longitude, radius
+
+
+def _squared_distance(latitude, longitude, lat_column, lon_column):
+    # Equirectangular approximation: plain arithmetic (no trigonometry in
+    # SQLite), within 0.5% of the great-circle distance at these radii
+    lon_scale = math.cos(math.radians(latitude))
+    return (((lat_column - latitude) * KM_PER_DEGREE) * ((lat_column - latitude) * KM_PER_DEGREE) +
+            ((lon_column - longitude) * KM_PER_DEGREE * lon_scale) *
+            ((lon_column - longitude) * KM_PER_DEGREE * lon_scale))
+
+
+def distance_km(latitude, longitude, product):
+    if product.latitude is None or product.longitude is None:
+        return None
+    return round(math.sqrt(_squared_distance(latitude, longitude, product.latitude, product.longitude)), 2)
+
+
+# Narrows a Product query to rows within radius_km and returns (query,
+# squared distance column) for sorting nearest first. The geohash prefix
+# ranges use ix_products_active_geohash, the bounding box trims their
+# corners, and only the rows left get the exact distance check.
+def apply_near(query, latitude, longitude, radius_km):
+    prefixes = covering_prefixes(latitude, longitude, radius_km)
+    if prefixes:
+        # '{' sorts after every geohash character in bytewise order (the
+        # column's collation, see models.Product). is_active is repeated in
+        # each branch so SQLite can answer every range from the index and
+        # union the results (MULTI-INDEX OR).
+        query = query.filter(or_(*(
+            and_(Product.is_active == True, Product.geohash >= prefix, Product.geohash < prefix + '{')
+            for prefix in prefixes
+        )))
+    lat_radius = radius_km / KM_PER_DEGREE
+    lon_radius = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    distance = _squared_distance(latitude, longitude, Product.latitude, Product.longitude)
+    query = query.filter(
+        Product.latitude.between(latitude - lat_radius, latitude + lat_radius),
+        Product.longitude.between(longitude - lon_radius, longitude + lon_radius),
+        distance <= radius_km * radius_km
+    )
+    return query, distance
+
+
+def locate(product):
+    province, point = place(product.location)
+    product.province = province
+    if point:
+        product.latitude, product.longitude = point
+        product.geohash = geohash(*point)
+    else:
+        product.latitude = product.longitude = product.geohash = None
+
+
+@event.listens_for(Product, 'before_insert')
+def _product_inserted(mapper, connection, product):
+    locate(product)
+
+
+@event.listens_for(Product, 'before_update')
+def _product_updated(mapper, connection, product):
+    if inspect(product).attrs.location.history.has_changes():
+        locate(product)
+
+
+# Adds the coordinate columns to databases created before they existed and
+# geocodes products that have none yet. Runs before ensure_indexes(), which
+# needs the geohash column.
+def ensure_product_geo(engine):
+    postgres = engine.dialect.name == 'postgresql'
+    geohash_type = 'VARCHAR(12) COLLATE "C"' if postgres else 'VARCHAR(12)'
+    with engine.begin() as connection:
+        existing = {column['name'] for column in inspect(connection).get_columns('products')}
+        for name, kind in (('latitude', 'FLOAT'), ('longitude', 'FLOAT'), ('geohash', geohash_type),
+                           ('province', 'VARCHAR(50)')):
+            if name not in existing:
+                connection.execute(text(f'ALTER TABLE products ADD COLUMN {name} {kind}'))
+        # A geohash column created with the database's default collation
+        # (NULL here) is switched over; its index is rebuilt with it
+        if postgres and connection.execute(text(
+            "SELECT collation_name IS DISTINCT FROM 'C' FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = 'products' AND column_name = 'geohash'"
+        )).scalar():
+            connection.execute(text(f'ALTER TABLE products ALTER COLUMN geohash TYPE {geohash_type}'))
+
+        rows = connection.execute(text(
+            "SELECT id, location FROM products WHERE province IS NULL AND location IS NOT NULL AND location != ''"
+        )).fetchall()
+        updates = []
+        for product_id, location in rows:
+            province, point = place(location)
+            if point:
+                updates.append({'id': product_id, 'latitude': point[0], 'longitude': point[1],
+                                'geohash': geohash(*point), 'province': province})
+        if updates:
+            connection.execute(text(
+                "UPDATE products SET latitude = :latitude, longitude = :longitude, geohash = :geohash, "
+                "province = :province WHERE id = :id"
+            ), updates)
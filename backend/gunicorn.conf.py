@@ -0,0 +1,35 @@
+# gunicorn loads ./gunicorn.conf.py by itself, so the Dockerfile, Procfile,
+# render.yaml and railway.json commands all share these settings. Command
+# line flags still override them.
+import os
+import sys
+
+bind = f'0.0.0.0:{os.getenv("PORT", "8080")}'
+# --preload: the app is imported once in the master and forked workers start
+# immediately (schema work runs before gunicorn, in `flask init-db`)
+preload_app = True
+timeout = 120
+
+# More than one process needs EVENTS_REDIS_URL, see on_starting()
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+# An open /api/orders/stream holds one of these threads for up to
+# EVENTS_MAX_STREAM_SECONDS. Streams may use all but GUNICORN_RESERVED_THREADS
+# of them, so one worker serves threads - reserved order pages at once and
+# the 503/polling fallback starts after that. Size GUNICORN_THREADS for the
+# expected number of open order pages per worker plus the reserve.
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+RESERVED_THREADS = int(os.getenv('GUNICORN_RESERVED_THREADS', 8))
+# Set before --preload imports events.py, which reads it at import
+os.environ.setdefault('EVENTS_MAX_STREAMS', str(max(threads - RESERVED_THREADS, 1)))
+
+
+# Without Redis every worker keeps its own order event buffer: an event
+# published in one worker never reaches streams held by the others, and
+# their clients only see `reset`. Refuse that setup rather than run it.
+def on_starting(server):
+    if server.cfg.workers > 1 and not os.getenv('EVENTS_REDIS_URL'):
+        print(f'Refusing to start {server.cfg.workers} workers without EVENTS_REDIS_URL: '
+              'order events would not cross workers. Set EVENTS_REDIS_URL or WEB_CONCURRENCY=1.',
+              file=sys.stderr)
+        sys.exit(1)
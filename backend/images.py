@@ -0,0 +1,171 @@
+import glob
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+# Longest edge in pixels; images are never upscaled
+IMAGE_VARIANTS = {'thumb': 160, 'sm': 480, 'md': 960, 'lg': 1600}
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 80))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+CHUNK_SIZE = 64 * 1024
+
+HASHED_NAME_RE = re.compile(r'^([0-9a-f]{32})\.(\w+)$')
+VARIANT_NAME_RE = re.compile(r'^([0-9a-f]{32})-(\w+)\.(webp|avif)$')
+
+_executor = None
+_lock = threading.Lock()
+_scheduled = set()
+_formats = None
+
+
+def variant_formats():
+    global _formats
+    if _formats is None:
+        _formats = []
+        if Image is not None:
+            _formats = [fmt for fmt in ('webp', 'avif') if features.check(fmt)]
+    return _formats
+
+
+# Copies an uploaded file to disk in chunks while hashing it, and names it
+# after the content hash. Werkzeug has already spooled large uploads to a
+# temporary file, so nothing here holds the whole image in memory.
+# Re-uploads of the same image reuse the stored file.
+def save_upload(file_storage, folder, extension):
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+        filename = f'{digest.hexdigest()[:32]}.{extension}'
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+
+def variant_name(filename, variant, fmt):
+    return f"{filename.rsplit('.', 1)[0]}-{variant}.{fmt}"
+
+
+# Left next to the originals when a variant can't be produced (unreadable
+# image, an encoder Pillow lacks), so it isn't retried on every request for
+# it. The leading dot keeps it out of reach of the upload route; delete the
+# markers to retry, e.g. after installing AVIF support.
+def failure_marker(folder, name):
+    return os.path.join(folder, f'.failed-{name}')
+
+
+def _pending(folder, filename):
+    pending = []
+    for variant in IMAGE_VARIANTS:
+        for fmt in variant_formats():
+            name = variant_name(filename, variant, fmt)
+            if not os.path.exists(os.path.join(folder, name)) and not os.path.exists(failure_marker(folder, name)):
+                pending.append((variant, fmt))
+    return pending
+
+
+def _mark_failed(folder, filename, pending, error):
+    print(f"Image variant error for {filename}: {str(error)}")
+    for variant, fmt in pending:
+        with open(failure_marker(folder, variant_name(filename, variant, fmt)), 'w') as out:
+            out.write(str(error))
+
+
+def schedule_variants(folder, filename):
+    global _executor
+    if not HASHED_NAME_RE.match(filename) or not _pending(folder, filename):
+        return
+    with _lock:
+        # Already queued or running in this process
+        if filename in _scheduled:
+            return
+        _scheduled.add(filename)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+    _executor.submit(generate_variants, folder, filename)
+
+
+# Writes each missing size in every available modern format. Metadata
+# (EXIF, GPS, ICC) is dropped because it is never passed to save(); the
+# EXIF orientation is applied to the pixels first. Variants that fail get a
+# failure marker instead of being retried.
+def generate_variants(folder, filename):
+    try:
+        _generate(folder, filename)
+    finally:
+        with _lock:
+            _scheduled.discard(filename)
+
+
+def _generate(folder, filename):
+    pending = _pending(folder, filename)
+    if not pending:
+        return
+    try:
+        with Image.open(os.path.join(folder, filename)) as source:
+            image = ImageOps.exif_transpose(source)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    except Exception as e:
+        _mark_failed(folder, filename, pending, e)
+        return
+    for variant, edge in IMAGE_VARIANTS.items():
+        formats = [fmt for v, fmt in pending if v == variant]
+        if not formats:
+            continue
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        for fmt in formats:
+            fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.variant-')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    resized.save(out, fmt.upper(), quality=IMAGE_QUALITY)
+                os.replace(tmp_path, os.path.join(folder, variant_name(filename, variant, fmt)))
+            except Exception as e:
+                os.remove(tmp_path)
+                _mark_failed(folder, filename, [(variant, fmt)], e)
+
+
+# {'thumb': {'webp': url, 'avif': url}, 'sm': ...} for content-addressed
+# uploads; older uploads have no variants
+def image_variants(image_url):
+    if not image_url or not image_url.startswith('/api/uploads/'):
+        return {}
+    filename = image_url.rsplit('/', 1)[1]
+    if not HASHED_NAME_RE.match(filename):
+        return {}
+    formats = variant_formats()
+    return {variant: {fmt: f'/api/uploads/{variant_name(filename, variant, fmt)}' for fmt in formats}
+            for variant in IMAGE_VARIANTS if formats}
+
+
+# The original behind a variant name, for serving while the variant is
+# still being generated (or was lost)
+def original_for_variant(folder, filename):
+    match = VARIANT_NAME_RE.match(filename)
+    if not match:
+        return None
+    for path in glob.glob(os.path.join(folder, f'{match.group(1)}.*')):
+        return os.path.basename(path)
+    return None
@@ -0,0 +1,54 @@
+import os
+import random
+import time
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+from models import db, Product
+
+ORDER_RETRIES = int(os.getenv('ORDER_RETRIES', 5))
+ORDER_RETRY_BACKOFF = float(os.getenv('ORDER_RETRY_BACKOFF', 0.02))  # seconds, doubled per attempt
+# SQLite lock timeouts, and Postgres serialization failures and deadlocks
+TRANSIENT_MESSAGES = ('database is locked', 'database table is locked')
+TRANSIENT_SQLSTATES = {'40001', '40P01'}
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+# Checks and decrements stock in one statement, so two buyers can never both
+# see the last units: the second UPDATE matches no row. Only the product row
+# is locked, and only for the rest of the transaction.
+def reserve_stock(product_id, quantity):
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.quantity >= quantity)
+        .values(quantity=Product.quantity - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise InsufficientStock(product_id)
+
+
+def is_transient(error):
+    orig = error.orig
+    # psycopg2 exposes the SQLSTATE as pgcode, psycopg 3 as sqlstate
+    code = getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)
+    if code:
+        return code in TRANSIENT_SQLSTATES
+    return any(message in str(orig) for message in TRANSIENT_MESSAGES)
+
+
+# Runs `work` (which should commit) again after lock conflicts such as
+# SQLite's "database is locked" or a Postgres deadlock, with jittered
+# exponential backoff. Other errors, including operational ones that a retry
+# can't fix (a missing table, a dropped connection), propagate immediately.
+def with_retries(work):
+    for attempt in range(ORDER_RETRIES):
+        try:
+            return work()
+        except OperationalError as e:
+            db.session.rollback()
+            if not is_transient(e) or attempt == ORDER_RETRIES - 1:
+                raise
+            time.sleep(ORDER_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
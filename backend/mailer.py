@@ -0,0 +1,154 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from models import db, OutboxMessage
+
+MAIL_WORKERS = int(os.getenv('MAIL_WORKERS', 2))
+MAIL_QUEUE_SIZE = int(os.getenv('MAIL_QUEUE_SIZE', 1000))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 20))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+MAIL_RETRY_BASE = float(os.getenv('MAIL_RETRY_BASE', 30))  # seconds, doubled per attempt
+MAIL_POLL_INTERVAL = float(os.getenv('MAIL_POLL_INTERVAL', 15))  # seconds
+MAIL_SEND_LEASE = 300  # seconds before a message stuck in 'sending' is retried
+
+
+# Sends mail from background threads so requests only pay for an INSERT into
+# the outbox table. Each worker thread drains up to MAIL_BATCH_SIZE ids from
+# the queue and sends them over one SMTP connection. Failed sends are retried
+# with exponential backoff by the poller, which also picks up messages left
+# over from a restart or dropped because the queue was full.
+class MailDispatcher:
+    def __init__(self):
+        self.app = None
+        self.mail = None
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=MAIL_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._started = False
+
+    # Flask-Mail is only imported once the first message is delivered
+    def init_app(self, app):
+        self.app = app
+
+    def start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for i in range(MAIL_WORKERS):
+                threading.Thread(target=self._work, name=f'mail-worker-{i}', daemon=True).start()
+            threading.Thread(target=self._poll, name='mail-poller', daemon=True).start()
+            self._started = True
+
+    def enqueue(self, subject, recipients, html):
+        message = OutboxMessage(subject=subject, recipients=','.join(recipients), html=html)
+        db.session.add(message)
+        db.session.commit()
+        self.start()
+        try:
+            self._queue.put_nowait(message.id)
+        except queue.Full:
+            pass  # stays pending in the outbox until the poller finds it
+        return message.id
+
+    def _work(self):
+        while True:
+            ids = [self._queue.get()]
+            while len(ids) < MAIL_BATCH_SIZE:
+                try:
+                    ids.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.app.app_context():
+                    self._deliver(ids)
+            except Exception as e:
+                self.app.logger.error(f'Mail delivery error: {e}')
+
+    def _poll(self):
+        while True:
+            time.sleep(MAIL_POLL_INTERVAL)
+            try:
+                with self.app.app_context():
+                    due = db.session.query(OutboxMessage.id).filter(
+                        OutboxMessage.status.in_(['pending', 'sending']),
+                        OutboxMessage.next_attempt_at <= datetime.utcnow()
+                    ).order_by(OutboxMessage.next_attempt_at).limit(MAIL_QUEUE_SIZE // 2).all()
+                for (message_id,) in due:
+                    self._queue.put_nowait(message_id)
+            except queue.Full:
+                pass
+            except Exception as e:
+                self.app.logger.error(f'Mail outbox poll error: {e}')
+
+    # Marks a due message as 'sending' unless another thread or process got
+    # there first
+    def _claim(self, message_id):
+        now = datetime.utcnow()
+        claimed = OutboxMessage.query.filter(
+            OutboxMessage.id == message_id,
+            OutboxMessage.status.in_(['pending', 'sending']),
+            OutboxMessage.next_attempt_at <= now
+        ).update({
+            OutboxMessage.status: 'sending',
+            OutboxMessage.next_attempt_at: now + timedelta(seconds=MAIL_SEND_LEASE)
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def _connection(self):
+        from flask_mail import Mail
+
+        with self._lock:
+            if self.mail is None:
+                self.mail = Mail(self.app)
+        return self.mail.connect()
+
+    def _deliver(self, ids):
+        from flask_mail import Message
+
+        messages = [OutboxMessage.query.get(i) for i in ids if self._claim(i)]
+        if not messages:
+            return
+        try:
+            with self._connection() as connection:
+                for message in messages:
+                    try:
+                        connection.send(Message(
+                            subject=message.subject,
+                            recipients=message.recipients.split(','),
+                            html=message.html
+                        ))
+                        message.status = 'sent'
+                        message.sent_at = datetime.utcnow()
+                        self.sent += 1
+                    except Exception as e:
+                        self._failed(message, e)
+                    db.session.commit()
+        except Exception as e:
+            # Connecting (or closing) the SMTP session failed
+            for message in messages:
+                if message.status == 'sending':
+                    self._failed(message, e)
+            db.session.commit()
+
+    def _failed(self, message, error):
+        message.attempts = (message.attempts or 0) + 1
+        message.last_error = str(error)
+        if message.attempts >= MAIL_MAX_ATTEMPTS:
+            message.status = 'failed'
+            self.failed += 1
+        else:
+            message.status = 'pending'
+            delay = MAIL_RETRY_BASE * 2 ** (message.attempts - 1)
+            message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'sent': self.sent, 'failed': self.failed}
+
+
+mail_dispatcher = MailDispatcher()
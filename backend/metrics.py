@@ -0,0 +1,241 @@
+import cProfile
+import hmac
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# Fraction of requests profiled in production; 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+# Enables ?__profile=1 for requests that also send this value in the
+# X-Profile-Token header; unset (the default) disables the parameter
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'profiles'))
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+
+# Per-route request metrics kept in process memory, one set per gunicorn
+# worker; Prometheus sums them across scrape targets
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # `extra` maps metric name -> (kind, help, value) for figures owned by
+    # other modules, such as cache and mail counters
+    def render(self, extra=None):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets))
+                                for key, h in self._histograms.items())
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {self._help.get(name, (kind, name))[1]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{{{_labels(labels)}}} {value}')
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            header(name, 'histogram')
+            prefix = _labels(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{prefix},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{prefix}}} {total}')
+            lines.append(f'{name}_count{{{prefix}}} {count}')
+        for name, (kind, text, value) in (extra or {}).items():
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('tarim_requests_total', 'counter', 'Requests by route, method and status')
+metrics.describe('tarim_request_duration_seconds', 'histogram', 'Time spent in the view and request hooks')
+metrics.describe('tarim_db_queries_per_request', 'histogram', 'SQL statements executed per request')
+metrics.describe('tarim_db_seconds_total', 'counter', 'Time spent executing SQL')
+metrics.describe('tarim_serialize_seconds_total', 'counter',
+                 'Time spent turning rows into response bodies (field extraction and encoding, streams included)')
+metrics.describe('tarim_response_bytes', 'histogram', 'Response body size (streamed responses excluded)')
+
+
+# SQL timing for whatever engine runs the statement (primary or replica),
+# attributed to the current request
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_start' in g:
+        g.db_queries += 1
+        g.db_seconds += time.perf_counter() - conn.info.pop('query_start', time.perf_counter())
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+# Streamed bodies are generated after the request was recorded, so their
+# time goes to the counter directly
+def record_serialize_seconds(seconds):
+    if not has_request_context() or 'metrics_start' not in g:
+        return
+    if g.get('metrics_recorded'):
+        metrics.inc('tarim_serialize_seconds_total', (('route', _route()), ('method', request.method)), seconds)
+    else:
+        g.serialize_seconds += seconds
+
+
+# Wraps the serializer calls of a listing: compiled field extraction, or
+# anything else that builds the body outside jsonify()
+@contextmanager
+def serialize_timer():
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_serialize_seconds(time.perf_counter() - start)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with serialize_timer():
+            return super().dumps(obj, **kwargs)
+
+
+def _start_profiler():
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+# Writes a pyinstrument HTML report or a cProfile .prof file (open with
+# `python -m pstats` or snakeviz) and returns its name
+def _dump_profile(profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = _route().strip('/').replace('/', '_').replace('<', '').replace('>', '').replace(':', '-') or 'root'
+    name = f"{datetime.utcnow():%Y%m%d-%H%M%S-%f}-{request.method}-{slug}"
+    if Profiler is not None:
+        profiler.stop()
+        name += '.html'
+        with open(os.path.join(PROFILE_DIR, name), 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        name += '.prof'
+        profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    return name
+
+
+def _profile_requested(token):
+    if not token or request.args.get('__profile') != '1':
+        return False
+    return hmac.compare_digest(request.headers.get('X-Profile-Token', ''), token)
+
+
+# With `profile_token` set, ?__profile=1 plus a matching X-Profile-Token
+# header profiles that request; PROFILE_SAMPLE_RATE samples the rest. Call
+# before registering other after_request hooks so the timing covers them.
+def init_metrics(app, profile_token=PROFILE_TOKEN):
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.db_queries = 0
+        g.db_seconds = 0.0
+        g.serialize_seconds = 0.0
+        if _profile_requested(profile_token) or \
+                (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+            g.profiler = _start_profiler()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_start' not in g:
+            return response
+        if g.get('profiler') is not None:
+            try:
+                response.headers['X-Profile'] = _dump_profile(g.pop('profiler'))
+            except Exception as e:
+                print(f"Profile dump error: {str(e)}")
+        route = _route()
+        metrics.inc('tarim_requests_total', (('route', route), ('method', request.method),
+                                             ('status', response.status_code)))
+        labels = (('route', route), ('method', request.method))
+        metrics.observe('tarim_request_duration_seconds', labels,
+                        time.perf_counter() - g.metrics_start, LATENCY_BUCKETS)
+        metrics.observe('tarim_db_queries_per_request', labels, g.db_queries, QUERY_BUCKETS)
+        metrics.inc('tarim_db_seconds_total', labels, g.db_seconds)
+        metrics.inc('tarim_serialize_seconds_total', labels, g.serialize_seconds)
+        g.metrics_recorded = True
+        if not response.is_streamed:
+            metrics.observe('tarim_response_bytes', labels, response.calculate_content_length() or 0, SIZE_BUCKETS)
+        return response
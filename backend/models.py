@@ -1,9 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import os
+from database import RoutingSession
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -50,12 +51,31 @@ class Product(db.Model):
     image_url = db.Column(db.String(255))
     harvest_date = db.Column(db.DateTime)
     location = db.Column(db.String(255))
+    # Geocoded from location (see geo.py); None when the place is unknown
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # Prefix ranges over it assume bytewise ordering, which SQLite's default
+    # BINARY collation gives; Postgres would otherwise use the cluster locale
+    geohash = db.Column(db.String(12).with_variant(db.String(12, collation='C'), 'postgresql'))
+    province = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
     orders = db.relationship('Order', backref='product', lazy=True)
 
+    # Listing filters always include is_active and sort by created_at
+    __table_args__ = (
+        db.Index('ix_products_active_created', 'is_active', 'created_at'),
+        db.Index('ix_products_active_category_created', 'is_active', 'category_id', 'created_at'),
+        db.Index('ix_products_active_seller_created', 'is_active', 'seller_id', 'created_at'),
+        db.Index('ix_products_active_price', 'is_active', 'price'),
+        # MIN/MAX(price) per category for category_stats
+        db.Index('ix_products_active_category_price', 'is_active', 'category_id', 'price'),
+        db.Index('ix_products_active_geohash', 'is_active', 'geohash'),
+        db.Index('ix_products_active_harvest', 'is_active', 'harvest_date'),
+    )
+
     def __repr__(self):
         return f'<Product {self.name}>'
 
@@ -74,5 +94,88 @@ class Order(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     delivery_date = db.Column(db.DateTime)
     
+    # Listings sort by (created_at, id) under an optional buyer/seller and
+    # status filter; without status the *_status_* indexes can't give the order
+    __table_args__ = (
+        db.Index('ix_orders_buyer_created', 'buyer_id', 'created_at', 'id'),
+        db.Index('ix_orders_seller_created', 'seller_id', 'created_at', 'id'),
+        db.Index('ix_orders_created', 'created_at', 'id'),
+        db.Index('ix_orders_buyer_status_created', 'buyer_id', 'status', 'created_at'),
+        db.Index('ix_orders_seller_status_created', 'seller_id', 'status', 'created_at'),
+        db.Index('ix_orders_status_created', 'status', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Order {self.id}>'
+
+# Per-seller order aggregates, updated in the same transaction as the orders
+# they summarize so the dashboard never has to scan order history
+class SellerDailyStats(db.Model):
+    __tablename__ = 'seller_daily_stats'
+    seller_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)  # order creation date
+    status = db.Column(db.String(50), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class SellerProductStats(db.Model):
+    __tablename__ = 'seller_product_stats'
+    seller_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)  # cancelled orders excluded
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+# Per-category aggregates behind GET /api/products/facets, maintained with
+# the products and orders they summarize (see facets.py)
+class CategoryStats(db.Model):
+    __tablename__ = 'category_stats'
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False, default=0)  # active products
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    units_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+# Active products per category and facet value: facet is 'price' (bucket
+# lower bound), 'location' (province) or 'unit'
+class CategoryFacetStats(db.Model):
+    __tablename__ = 'category_facet_stats'
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(120), primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'mail_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)  # comma separated
+    html = db.Column(db.Text)
+    status = db.Column(db.String(20), default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)  # retry time, or lease expiry while sending
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_mail_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def __repr__(self):
+        return f'<OutboxMessage {self.id}>'
+
+# db.create_all() skips tables that already exist, including their indexes,
+# so databases created before an index was declared need it added here.
+# CREATE INDEX works in place on both SQLite and Postgres. ANALYZE refreshes
+# planner statistics; without them SQLite cannot tell the (is_active, ...)
+# indexes apart and picks one that does not match the query.
+def ensure_indexes(engine):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
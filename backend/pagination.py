@@ -0,0 +1,132 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, tuple_
+
+# No default page size: the frontend requests listings without limit and
+# doesn't follow X-Next-Cursor, so those still get the whole result
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def parse_limit(raw):
+    if raw is None or raw == '':
+        return None
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise PaginationError('Invalid limit')
+    if limit < 1:
+        raise PaginationError('Invalid limit')
+    return min(limit, MAX_LIMIT)
+
+
+def parse_sort(raw_sort, raw_order, allowed, default):
+    sort = raw_sort or default
+    if sort not in allowed:
+        raise PaginationError(f"Invalid sort, expected one of: {', '.join(allowed)}")
+    order = (raw_order or 'desc').lower()
+    if order not in ('asc', 'desc'):
+        raise PaginationError('Invalid order, expected asc or desc')
+    return sort, order == 'desc'
+
+
+def encode_cursor(sort, descending, value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, 'desc' if descending else 'asc', value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+# A cursor's sort value back to the column's Python type. Expressions
+# without one (relevance rank, distance) are numeric. Anything else is
+# refused here rather than compared against the column, which SQLite would
+# answer with a wrong page and Postgres with an error.
+def _cursor_value(value, column, nullable):
+    if value is None:
+        if not nullable:
+            raise ValueError('NULL sort value')
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = float
+    if python_type is datetime:
+        if not isinstance(value, str):
+            raise TypeError('Expected an ISO timestamp')
+        return datetime.fromisoformat(value)
+    if python_type in (int, float):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise TypeError('Expected a number')
+        return python_type(value)
+    if not isinstance(value, python_type):
+        raise TypeError(f'Expected {python_type.__name__}')
+    return value
+
+
+def decode_cursor(token, sort, descending, column, nullable=False):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        cursor_sort, cursor_order, value, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    # A cursor is only meaningful for the ordering that produced it
+    if cursor_sort != sort or cursor_order != ('desc' if descending else 'asc'):
+        raise PaginationError('Cursor does not match sort order')
+    try:
+        value = _cursor_value(value, column, nullable)
+        if isinstance(row_id, bool) or not isinstance(row_id, int):
+            raise TypeError('Expected an integer id')
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    return value, row_id
+
+
+def _after(column, id_column, descending, value, row_id, nullable):
+    if not nullable:
+        if descending:
+            return tuple_(column, id_column) < tuple_(value, row_id)
+        return tuple_(column, id_column) > tuple_(value, row_id)
+
+    # Nullable columns sort NULLs last in both directions
+    if value is None:
+        return and_(column.is_(None), id_column < row_id if descending else id_column > row_id)
+    if descending:
+        return or_(column < value, and_(column == value, id_column < row_id), column.is_(None))
+    return or_(column > value, and_(column == value, id_column > row_id), column.is_(None))
+
+
+# Orders `query` by (column, id) and keeps only the rows after `cursor`.
+# That is a range predicate on the sort key instead of OFFSET, so page N
+# costs the same as page 1. Pass nullable=True for sort columns that may
+# hold NULLs (they sort last).
+def keyset_order(query, column, id_column, sort, descending, cursor=None, nullable=False):
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort, descending, column, nullable)
+        query = query.filter(_after(column, id_column, descending, value, row_id, nullable))
+
+    if descending:
+        sort_key = column.desc().nulls_last() if nullable else column.desc()
+        return query.order_by(sort_key, id_column.desc())
+    sort_key = column.asc().nulls_last() if nullable else column.asc()
+    return query.order_by(sort_key, id_column.asc())
+
+
+# Fetches one keyset_order() page and returns (rows, next_cursor). Pass `key`
+# when rows are not plain model instances. Without a limit the whole ordered
+# result is returned.
+def keyset_page(query, column, id_column, sort, descending, limit=None, cursor=None,
+                nullable=False, key=None):
+    query = keyset_order(query, column, id_column, sort, descending, cursor, nullable)
+    if limit is None:
+        return query.all(), None
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    value, row_id = key(rows[-1]) if key else (getattr(rows[-1], column.key), rows[-1].id)
+    return rows, encode_cursor(sort, descending, value, row_id)
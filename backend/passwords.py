@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Any werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'.
+# Lowering the cost makes logins cheaper; stored hashes are upgraded (or
+# downgraded) to the configured method on the next successful login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+# Processes used for hashing; 0 hashes inline in the request thread
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
+_executor = None
+_lock = threading.Lock()
+_method_prefix = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                # spawn: forking a process that already runs mail threads is unsafe
+                _executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _executor
+
+
+# Runs the hash function in the pool so the request thread only waits on a
+# future instead of burning CPU under the GIL
+def _run(fn, *args, **kwargs):
+    global _executor
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args, **kwargs)
+    try:
+        return _pool().submit(fn, *args, **kwargs).result()
+    except BrokenProcessPool:
+        with _lock:
+            _executor = None
+        return fn(*args, **kwargs)
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, method=PASSWORD_HASH_METHOD)
+
+
+def verify_password(pwhash, password):
+    if not pwhash:
+        return False  # Google OAuth accounts have no password
+    return _run(check_password_hash, pwhash, password)
+
+
+# Werkzeug fills in default parameters ('pbkdf2:sha256' is stored as
+# 'pbkdf2:sha256:600000'), so compare against a real hash's prefix
+def needs_rehash(pwhash):
+    global _method_prefix
+    if _method_prefix is None:
+        _method_prefix = hash_password('').split('$', 1)[0]
+    return pwhash.split('$', 1)[0] != _method_prefix
@@ -0,0 +1,339 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import g, jsonify, request
+from metrics import metrics
+from events import streams_open
+from search import fold
+
+
+def _parse_limit(value):
+    # 'N/S': bursts of N requests, refilled at N per S seconds; empty = no limit
+    if not value:
+        return None
+    count, _, seconds = value.partition('/')
+    return int(count), int(count) / float(seconds or 60)
+
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', '')
+RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH', '')  # shared by the workers of one host
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))  # memory backend
+RATE_LIMIT_IDLE_SECONDS = int(os.getenv('RATE_LIMIT_IDLE_SECONDS', 3600))  # sqlite rows older than this are dropped
+# Header an edge proxy sets to the client address (e.g. X-Real-IP), used
+# instead of the X-Forwarded-For hops counted by TRUSTED_PROXIES
+RATE_LIMIT_CLIENT_IP_HEADER = os.getenv('RATE_LIMIT_CLIENT_IP_HEADER', '')
+# Per-IP buckets: 'True', 'False', or unset to use them only when the client
+# address is known to be the client's (TRUSTED_PROXIES or the header above
+# configured). Behind an unconfigured proxy every user shares the proxy's
+# address, and one bucket would throttle the whole site.
+RATE_LIMIT_BY_IP = os.getenv('RATE_LIMIT_BY_IP', '')
+# Per client and route class: (capacity, tokens per second)
+RATE_LIMITS = {
+    'auth': _parse_limit(os.getenv('RATE_LIMIT_AUTH', '10/60')),
+    'search': _parse_limit(os.getenv('RATE_LIMIT_SEARCH', '120/60')),
+    'write': _parse_limit(os.getenv('RATE_LIMIT_WRITE', '60/60')),
+    'read': _parse_limit(os.getenv('RATE_LIMIT_READ', ''))
+}
+# Requests a worker process runs at once, per route class and in total;
+# 0 = no cap. Auth is kept low because password hashing is slow and would
+# otherwise take every thread during a login burst.
+MAX_CONCURRENT = {
+    'auth': int(os.getenv('MAX_CONCURRENT_AUTH', 4)),
+    'search': int(os.getenv('MAX_CONCURRENT_SEARCH', 0)),
+    'write': int(os.getenv('MAX_CONCURRENT_WRITE', 0)),
+    'read': int(os.getenv('MAX_CONCURRENT_READ', 0))
+}
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 0))
+# Requests that waited longer than this in front of the app (X-Request-Start
+# from the router or nginx) are shed instead of served late; 0 = off
+SHED_QUEUE_MS = int(os.getenv('SHED_QUEUE_MS', 0))
+SHED_RETRY_AFTER = 1  # seconds
+
+AUTH_ENDPOINTS = {'api.login', 'api.register', 'api.google_login'}
+SEARCH_ENDPOINTS = {'api.get_products', 'api.get_product_facets'}
+EXEMPT_ENDPOINTS = {'api.root', 'api.health', 'api.prometheus_metrics', 'api.cache_stats'}
+READ_METHODS = ('GET', 'HEAD')
+
+
+# Token bucket arithmetic shared by the backends: returns the tokens left
+# and, when the request is refused, the seconds until one is available
+def _take(tokens, updated, capacity, rate, now):
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+# Buckets for this process only: with several workers the effective limit
+# is the configured one times the number of workers
+class MemoryBackend:
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (None, now))
+            tokens, wait = _take(tokens, updated, capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # An evicted bucket comes back full, which only errs towards allowing
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# One SQLite file shared by the workers of a single host, separate from the
+# application database so limiter writes never wait on its lock
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_limit_buckets '
+                               '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, rate):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?',
+                                     (key,)).fetchone()
+            tokens, wait = _take(row[0] if row else None, row[1] if row else now, capacity, rate, now)
+            connection.execute('INSERT INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                               'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                               (key, tokens, now))
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                connection.execute('DELETE FROM rate_limit_buckets WHERE updated < ?',
+                                   (now - RATE_LIMIT_IDLE_SECONDS,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+
+# Read, refill, take and write in one script so concurrent workers can't
+# both spend the last token. Numbers go back as strings: Lua numbers are
+# truncated to integers on the way out.
+REDIS_TAKE = """
+local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = capacity
+if state[1] then
+    tokens = math.min(capacity, tonumber(state[1]) + math.max(now - tonumber(state[2]), 0) * rate)
+end
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+# Shared by every worker and host; any Redis-protocol server works
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(REDIS_TAKE)
+
+    def take(self, key, capacity, rate):
+        return float(self._take(keys=[f'ratelimit:{key}'], args=[capacity, rate, time.time()]))
+
+
+def _create_backend():
+    if RATE_LIMIT_REDIS_URL:
+        return RedisBackend(RATE_LIMIT_REDIS_URL)
+    if RATE_LIMIT_SQLITE_PATH:
+        return SQLiteBackend(RATE_LIMIT_SQLITE_PATH)
+    return MemoryBackend()
+
+
+class AdmissionControl:
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.in_flight = {}
+        self.in_flight_total = 0
+        self._lock = threading.Lock()
+
+    # Seconds to wait before retrying, or 0 when every bucket the request
+    # draws from had a token. A failing shared backend lets requests through.
+    def check_rate(self, keys, limit):
+        capacity, rate = limit
+        wait = 0
+        for key in keys:
+            try:
+                wait = max(wait, self.backend.take(key, capacity, rate))
+            except Exception as e:
+                print(f'Rate limit backend error: {e}')
+        return wait
+
+    def enter(self, route_class):
+        with self._lock:
+            cap = MAX_CONCURRENT.get(route_class)
+            if cap and self.in_flight.get(route_class, 0) >= cap:
+                return False
+            # Open order streams hold threads too, though they leave
+            # admission as soon as their response has been returned
+            if MAX_CONCURRENT_REQUESTS and self.in_flight_total + streams_open() >= MAX_CONCURRENT_REQUESTS:
+                return False
+            self.in_flight[route_class] = self.in_flight.get(route_class, 0) + 1
+            self.in_flight_total += 1
+            return True
+
+    def leave(self, route_class):
+        with self._lock:
+            self.in_flight[route_class] -= 1
+            self.in_flight_total -= 1
+
+
+admission = AdmissionControl(_create_backend())
+
+metrics.describe('tarim_rate_limited_total', 'counter', 'Requests refused with 429 by the per-client rate limits')
+metrics.describe('tarim_shed_total', 'counter', 'Requests refused with 503 by load shedding')
+
+
+# Listings only count as searches when they carry ?search=, which is what
+# makes them expensive
+def route_class(endpoint, method, searching=False):
+    if method == 'OPTIONS' or endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return None
+    if endpoint in AUTH_ENDPOINTS:
+        return 'auth'
+    if method not in READ_METHODS:
+        return 'write'
+    if searching and endpoint in SEARCH_ENDPOINTS:
+        return 'search'
+    return 'read'
+
+
+def client_address():
+    if RATE_LIMIT_CLIENT_IP_HEADER:
+        value = request.headers.get(RATE_LIMIT_CLIENT_IP_HEADER, '').split(',')[0].strip()
+        if value:
+            return value
+    return request.remote_addr
+
+
+# Buckets a request draws from: the client IP (when by_ip), plus the
+# account for login attempts so one username can't be tried from many
+# addresses
+def client_keys(cls, by_ip=True):
+    keys = [f'{cls}:ip:{client_address()}'] if by_ip else []
+    if cls == 'auth':
+        data = request.get_json(silent=True)
+        username = None
+        if isinstance(data, dict):
+            username = data.get('username') or data.get('email')
+        if isinstance(username, str) and username:
+            keys.append(f'auth:user:{fold(username).strip()}')
+    return keys
+
+
+# Seconds the request spent queued before reaching the app, from the
+# X-Request-Start header set by Heroku/Render routers or nginx
+# ("t=<seconds>", milliseconds or microseconds since the epoch)
+def queued_seconds():
+    raw = request.headers.get('X-Request-Start', '').removeprefix('t=')
+    try:
+        started = float(raw)
+    except ValueError:
+        return None
+    while started > 1e11:
+        started /= 1000
+    return time.time() - started
+
+
+def _too_many(wait):
+    response = jsonify({'error': 'Too many requests, please slow down'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(math.ceil(wait), 1))
+    return response
+
+
+def _shed(cls, reason):
+    metrics.inc('tarim_shed_total', (('class', cls), ('reason', reason)))
+    response = jsonify({'error': 'Server busy, please retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(SHED_RETRY_AFTER)
+    return response
+
+
+def stats():
+    with admission._lock:
+        return {'in_flight': admission.in_flight_total, 'backend': type(admission.backend).__name__}
+
+
+# Registered right after init_metrics(), so refused requests are still
+# counted and timed but never reach the database or the views.
+# `client_ip_known` says whether request.remote_addr is the client's own
+# address (ProxyFix configured); see RATE_LIMIT_BY_IP.
+def init_rate_limits(app, client_ip_known=False):
+    if not RATE_LIMIT_ENABLED:
+        return
+    if RATE_LIMIT_BY_IP:
+        by_ip = RATE_LIMIT_BY_IP == 'True'
+    else:
+        by_ip = client_ip_known or bool(RATE_LIMIT_CLIENT_IP_HEADER)
+    if not by_ip:
+        print('Rate limits: client addresses not configured (TRUSTED_PROXIES, RATE_LIMIT_CLIENT_IP_HEADER '
+              'or RATE_LIMIT_BY_IP), so only the per-account login limit applies')
+
+    @app.before_request
+    def admit_request():
+        cls = route_class(request.endpoint, request.method, bool(request.args.get('search')))
+        if cls is None:
+            return None
+
+        if SHED_QUEUE_MS:
+            queued = queued_seconds()
+            if queued is not None and queued * 1000 > SHED_QUEUE_MS:
+                return _shed(cls, 'queue')
+
+        limit = RATE_LIMITS.get(cls)
+        keys = client_keys(cls, by_ip) if limit else []
+        if keys:
+            wait = admission.check_rate(keys, limit)
+            if wait:
+                metrics.inc('tarim_rate_limited_total', (('class', cls),))
+                return _too_many(wait)
+
+        if not admission.enter(cls):
+            return _shed(cls, 'concurrency')
+        g.admitted_class = cls
+        return None
+
+    # Teardown also runs when the view raised. It comes after the body for
+    # stream_with_context responses (exports), which keep their slot while
+    # sending; the order event stream doesn't use it and is capped by
+    # EVENTS_MAX_STREAMS instead.
+    @app.teardown_request
+    def release_request(exception=None):
+        cls = g.pop('admitted_class', None)
+        if cls is not None:
+            admission.leave(cls)
@@ -0,0 +1,186 @@
+import re
+from sqlalchemy import Float, Integer, event, inspect, text
+from sqlalchemy.exc import OperationalError
+from models import Product
+
+# Search matches dotted and dotless i, and ş/ğ/ç/ö/ü against their plain
+# letters, so "sut", "SÜT" and "süt" all find "Süt". str.lower() alone would
+# turn "İ" into "i̇" and leave "I" as "i" instead of "ı".
+TURKISH_FOLD = str.maketrans({
+    'İ': 'i', 'I': 'i', 'ı': 'i', 'Î': 'i', 'î': 'i',
+    'Ş': 's', 'ş': 's',
+    'Ğ': 'g', 'ğ': 'g',
+    'Ç': 'c', 'ç': 'c',
+    'Ö': 'o', 'ö': 'o',
+    'Ü': 'u', 'ü': 'u', 'Û': 'u', 'û': 'u',
+    'Â': 'a', 'â': 'a'
+})
+
+TOKEN_RE = re.compile(r'\w+')
+BACKFILL_BATCH = 1000
+
+# Name matches weigh more than description matches
+SQLITE_DDL = ("CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+              "name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+SQLITE_MATCH = ("SELECT rowid AS product_id, bm25(products_fts, 10.0, 1.0) AS rank "
+                "FROM products_fts WHERE products_fts MATCH :query")
+SQLITE_UPSERT = ("INSERT OR REPLACE INTO products_fts(rowid, name, description) "
+                 "VALUES (:id, :name, :description)")
+SQLITE_DELETE = "DELETE FROM products_fts WHERE rowid = :id"
+
+POSTGRES_DDL = (
+    "CREATE TABLE IF NOT EXISTS products_search ("
+    "product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE, "
+    "document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_document ON products_search USING GIN (document)"
+)
+POSTGRES_MATCH = ("SELECT product_id, -ts_rank(document, to_tsquery('simple', :query)) AS rank "
+                  "FROM products_search WHERE document @@ to_tsquery('simple', :query)")
+POSTGRES_UPSERT = (
+    "INSERT INTO products_search (product_id, document) VALUES (:id, "
+    "setweight(to_tsvector('simple', :name), 'A') || setweight(to_tsvector('simple', :description), 'B')) "
+    "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document"
+)
+POSTGRES_DELETE = "DELETE FROM products_search WHERE product_id = :id"
+
+# engine url -> 'fts5', 'tsvector' or None when no index table exists
+_backends = {}
+
+
+def fold(value):
+    return (value or '').translate(TURKISH_FOLD).lower()
+
+
+def tokens(term):
+    return TOKEN_RE.findall(fold(term))
+
+
+def _detect(connection):
+    key = str(connection.engine.url)
+    if key not in _backends:
+        dialect = connection.dialect.name
+        backend = None
+        if dialect == 'sqlite' and inspect(connection).has_table('products_fts'):
+            backend = 'fts5'
+        elif dialect == 'postgresql' and inspect(connection).has_table('products_search'):
+            backend = 'tsvector'
+        _backends[key] = backend
+    return _backends[key]
+
+
+def _index_params(product):
+    return {'id': product.id, 'name': fold(product.name), 'description': fold(product.description)}
+
+
+def index_product(connection, product):
+    backend = _detect(connection)
+    if backend is None:
+        return
+    if not product.is_active:
+        remove_product(connection, product.id)
+        return
+    sql = SQLITE_UPSERT if backend == 'fts5' else POSTGRES_UPSERT
+    connection.execute(text(sql), _index_params(product))
+
+
+# For bulk inserts, which bypass the mapper events below: indexes many new
+# (active) rows, given as dicts with id, name and description, in one
+# executemany
+def index_rows(connection, rows):
+    backend = _detect(connection)
+    if backend is None or not rows:
+        return
+    sql = SQLITE_UPSERT if backend == 'fts5' else POSTGRES_UPSERT
+    connection.execute(text(sql), [
+        {'id': row['id'], 'name': fold(row['name']), 'description': fold(row['description'])} for row in rows
+    ])
+
+
+def remove_product(connection, product_id):
+    backend = _detect(connection)
+    if backend is None:
+        return
+    sql = SQLITE_DELETE if backend == 'fts5' else POSTGRES_DELETE
+    connection.execute(text(sql), {'id': product_id})
+
+
+# Creates the search index if the database supports one and fills it from
+# existing products the first time. Databases without FTS5 fall back to
+# ILIKE filtering in apply_search().
+def ensure_search_index(engine):
+    _backends.pop(str(engine.url), None)
+    with engine.begin() as connection:
+        dialect = connection.dialect.name
+        existed = inspect(connection).has_table('products_fts' if dialect == 'sqlite' else 'products_search')
+        try:
+            if dialect == 'sqlite':
+                connection.execute(text(SQLITE_DDL))
+            elif dialect == 'postgresql':
+                for statement in POSTGRES_DDL:
+                    connection.execute(text(statement))
+            else:
+                return
+        except OperationalError:
+            # SQLite built without FTS5
+            return
+
+    if existed:
+        return
+    _backends.pop(str(engine.url), None)
+    with engine.begin() as connection:
+        sql = SQLITE_UPSERT if _detect(connection) == 'fts5' else POSTGRES_UPSERT
+        rows = connection.execute(
+            text("SELECT id, name, description FROM products WHERE is_active = :active"),
+            {'active': True}
+        )
+        while True:
+            batch = rows.fetchmany(BACKFILL_BATCH)
+            if not batch:
+                break
+            connection.execute(text(sql), [_index_params(row) for row in batch])
+
+
+# Narrows a Product query to rows matching `term`. Returns (query, rank),
+# where rank is a column to sort by ascending for best matches first, or
+# None when there is no index and the ILIKE fallback was used.
+def apply_search(query, term):
+    words = tokens(term)
+    if not words:
+        return query, None
+
+    backend = _detect(query.session.connection())
+    if backend is None:
+        pattern = f'%{term}%'
+        return query.filter(Product.name.ilike(pattern) | Product.description.ilike(pattern)), None
+
+    if backend == 'fts5':
+        match = ' '.join(f'"{word}"*' for word in words)
+        sql = SQLITE_MATCH
+    else:
+        match = ' & '.join(f'{word}:*' for word in words)
+        sql = POSTGRES_MATCH
+    matches = text(sql).bindparams(query=match).columns(product_id=Integer, rank=Float).subquery('search_matches')
+    query = query.join(matches, matches.c.product_id == Product.id)
+    return query, matches.c.rank
+
+
+def _changed(product, *names):
+    state = inspect(product)
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, product):
+    index_product(connection, product)
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, product):
+    # Order placement only touches quantity; skip re-indexing for that
+    if _changed(product, 'name', 'description', 'is_active'):
+        index_product(connection, product)
+
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, product):
+    remove_product(connection, product.id)
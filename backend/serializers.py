@@ -0,0 +1,167 @@
+from functools import lru_cache
+from operator import attrgetter
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only
+from images import image_variants
+from models import User, Category, Product, Order
+
+
+class FieldError(ValueError):
+    pass
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+# Maps response field names to attribute paths on a model ('seller.full_name'
+# follows a relationship), optionally with a converter. compile() turns a
+# field list into one attrgetter call plus the converters, cached per field
+# list, and load_options() turns it into load_only/joinedload options so
+# the SELECT only fetches the columns those fields need.
+class Serializer:
+    def __init__(self, model, fields, presets):
+        self.model = model
+        self.fields = {}
+        for name, spec in fields.items():
+            path, convert = spec if isinstance(spec, tuple) else (spec, None)
+            self.fields[name] = (path, convert)
+        self.presets = presets
+
+    # `requested` is the raw ?fields= value; without it the preset is used
+    def parse(self, requested, preset):
+        if not requested:
+            return self.presets[preset]
+        names = tuple(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise FieldError(f"Unknown fields: {', '.join(unknown)}" if unknown else 'No fields requested')
+        return names
+
+    @lru_cache(maxsize=128)
+    def compile(self, names):
+        plain = [name for name in names if self.fields[name][1] is None]
+        converted = [(name, attrgetter(self.fields[name][0]), self.fields[name][1])
+                     for name in names if self.fields[name][1] is not None]
+        if len(plain) == 1:
+            single = attrgetter(self.fields[plain[0]][0])
+            getter = lambda obj: (single(obj),)
+        elif plain:
+            getter = attrgetter(*(self.fields[name][0] for name in plain))
+        else:
+            getter = lambda obj: ()
+        plain = tuple(plain)
+
+        def serialize(obj):
+            data = dict(zip(plain, getter(obj)))
+            for name, get, convert in converted:
+                data[name] = convert(get(obj))
+            return data
+        return serialize
+
+    def serialize(self, obj, names):
+        return self.compile(names)(obj)
+
+    # `extra` names model attributes that must be loaded even if no field
+    # uses them, such as the keyset sort column
+    def load_options(self, names, extra=()):
+        mapper = inspect(self.model)
+        columns = set(extra)
+        related = {}
+        for name in names:
+            attribute, _, rest = self.fields[name][0].partition('.')
+            if rest:
+                related.setdefault(attribute, set()).add(rest)
+            else:
+                columns.add(attribute)
+
+        options = []
+        for attribute, related_columns in related.items():
+            relationship = mapper.relationships[attribute]
+            # The foreign key is needed to match the joined row
+            columns.update(column.key for column in relationship.local_columns)
+            target = relationship.mapper.class_
+            options.append(joinedload(getattr(self.model, attribute)).load_only(
+                *(getattr(target, column) for column in related_columns)
+            ))
+        options.append(load_only(*(getattr(self.model, column) for column in sorted(columns))))
+        return options
+
+
+USER_SESSION = ('id', 'username', 'email', 'full_name', 'role', 'location', 'phone')
+USER = Serializer(User, {
+    'id': 'id',
+    'username': 'username',
+    'email': 'email',
+    'full_name': 'full_name',
+    'role': 'role',
+    'location': 'location',
+    'phone': 'phone',
+    'description': 'description'
+}, {
+    'registered': ('id', 'username', 'email', 'full_name', 'role'),
+    'session': USER_SESSION,
+    'profile': USER_SESSION + ('description',)
+})
+
+CATEGORY = Serializer(Category, {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description'
+}, {
+    'default': ('id', 'name', 'description')
+})
+
+PRODUCT_LISTING = (
+    'id', 'name', 'description', 'price', 'quantity', 'unit', 'seller_id', 'seller_name',
+    'category_id', 'category_name', 'image_url', 'image_variants', 'harvest_date', 'location',
+    'created_at'
+)
+PRODUCT = Serializer(Product, {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'price': 'price',
+    'quantity': 'quantity',
+    'unit': 'unit',
+    'seller_id': 'seller_id',
+    'seller_name': 'seller.full_name',
+    'seller_location': 'seller.location',
+    'seller_phone': 'seller.phone',
+    'category_id': 'category_id',
+    'category_name': 'category.name',
+    'image_url': 'image_url',
+    'image_variants': ('image_url', image_variants),
+    'harvest_date': ('harvest_date', isoformat),
+    'location': 'location',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'created_at': ('created_at', isoformat)
+}, {
+    'listing': PRODUCT_LISTING,
+    'detail': PRODUCT_LISTING + ('seller_location', 'seller_phone', 'latitude', 'longitude'),
+    'created': ('id', 'name', 'price', 'quantity', 'image_url')
+})
+
+ORDER = Serializer(Order, {
+    'id': 'id',
+    'product_id': 'product_id',
+    'product_name': 'product.name',
+    'seller_id': 'seller_id',
+    'seller_name': 'seller_user.full_name',
+    'buyer_id': 'buyer_id',
+    'buyer_name': 'buyer_user.full_name',
+    'quantity': 'quantity',
+    'unit_price': 'unit_price',
+    'total_price': 'total_price',
+    'status': 'status',
+    'created_at': ('created_at', isoformat),
+    'notes': 'notes'
+}, {
+    'listing': ('id', 'product_id', 'product_name', 'seller_id', 'seller_name', 'buyer_id', 'buyer_name',
+                'quantity', 'unit_price', 'total_price', 'status', 'created_at', 'notes'),
+    'created': ('id', 'product_id', 'quantity', 'unit_price', 'total_price', 'status'),
+    # Pushed to GET /api/orders/stream; no relationships, so no extra queries
+    'event': ('id', 'product_id', 'seller_id', 'buyer_id', 'quantity', 'unit_price', 'total_price',
+              'status', 'created_at', 'notes')
+})
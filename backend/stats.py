@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+from sqlalchemy import Date, cast, func, insert, select, update
+from models import db, Product, Order, SellerDailyStats, SellerProductStats
+
+CANCELLED = 'cancelled'
+
+
+# INSERT ... ON CONFLICT DO UPDATE adding `deltas` to the existing counters,
+# so concurrent orders for one seller don't lose increments. Runs on the
+# session, or on `connection` from inside flush events.
+def increment(model, keys, deltas, connection=None):
+    if connection is None:
+        execute, dialect = db.session.execute, db.session.get_bind().dialect.name
+    else:
+        execute, dialect = connection.execute, connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        # Imported here: the postgresql dialect package is slow to import
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(model).values(**keys, **deltas)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: getattr(model, name) + statement.excluded[name] for name in deltas}
+        )
+        execute(statement)
+        return
+
+    updated = execute(update(model).filter_by(**keys).values(
+        {getattr(model, name): getattr(model, name) + value for name, value in deltas.items()}
+    )).rowcount
+    if not updated:
+        execute(insert(model).values(**keys, **deltas))
+
+
+def _day(created_at):
+    return (created_at or datetime.utcnow()).date()
+
+
+def _apply(seller_id, product_id, created_at, status, quantity, total_price, sign):
+    increment(SellerDailyStats,
+               {'seller_id': seller_id, 'day': _day(created_at), 'status': status or 'pending'},
+               {'order_count': sign, 'units': sign * quantity, 'revenue': sign * total_price})
+    if status != CANCELLED:
+        increment(SellerProductStats,
+                   {'seller_id': seller_id, 'product_id': product_id},
+                   {'order_count': sign, 'units': sign * quantity, 'revenue': sign * total_price})
+
+
+# Call before committing a new order (an Order or an inserted row dict)
+def record_order(order):
+    if isinstance(order, dict):
+        _apply(order['seller_id'], order['product_id'], order.get('created_at'), order.get('status'),
+               order['quantity'], order['total_price'], 1)
+    else:
+        _apply(order.seller_id, order.product_id, order.created_at, order.status,
+               order.quantity, order.total_price, 1)
+
+
+# Call before committing a status change
+def record_status_change(order, old_status):
+    if old_status == order.status:
+        return
+    _apply(order.seller_id, order.product_id, order.created_at, old_status,
+           order.quantity, order.total_price, -1)
+    _apply(order.seller_id, order.product_id, order.created_at, order.status,
+           order.quantity, order.total_price, 1)
+
+
+# Fills the summary tables from existing orders when they are empty, e.g.
+# right after they were added to an existing database
+def ensure_seller_stats(engine):
+    with engine.begin() as connection:
+        if connection.execute(select(func.count()).select_from(SellerDailyStats)).scalar():
+            return
+        if connection.dialect.name == 'sqlite':
+            day = func.date(Order.created_at)
+        else:
+            day = cast(Order.created_at, Date)
+        status = func.coalesce(Order.status, 'pending')
+        connection.execute(insert(SellerDailyStats).from_select(
+            ['seller_id', 'day', 'status', 'order_count', 'units', 'revenue'],
+            select(Order.seller_id, day, status, func.count(Order.id),
+                   func.sum(Order.quantity), func.sum(Order.total_price))
+            .group_by(Order.seller_id, day, status)
+        ))
+        connection.execute(insert(SellerProductStats).from_select(
+            ['seller_id', 'product_id', 'order_count', 'units', 'revenue'],
+            select(Order.seller_id, Order.product_id, func.count(Order.id),
+                   func.sum(Order.quantity), func.sum(Order.total_price))
+            .where(status != CANCELLED)
+            .group_by(Order.seller_id, Order.product_id)
+        ))
+
+
+def seller_stats(seller_id, days=30, top=5, low_stock=10):
+    by_status = {}
+    totals = {'order_count': 0, 'units': 0, 'revenue': 0.0}
+    rows = db.session.query(
+        SellerDailyStats.status,
+        func.sum(SellerDailyStats.order_count),
+        func.sum(SellerDailyStats.units),
+        func.sum(SellerDailyStats.revenue)
+    ).filter(SellerDailyStats.seller_id == seller_id).group_by(SellerDailyStats.status)
+    for status, order_count, units, revenue in rows:
+        if not order_count:
+            continue
+        by_status[status] = {'order_count': order_count, 'units': units, 'revenue': round(revenue, 2)}
+        if status != CANCELLED:
+            totals['order_count'] += order_count
+            totals['units'] += units
+            totals['revenue'] += revenue
+    totals['revenue'] = round(totals['revenue'], 2)
+
+    # UTC, like the _day() buckets it is compared against
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = db.session.query(
+        SellerDailyStats.day,
+        func.sum(SellerDailyStats.order_count),
+        func.sum(SellerDailyStats.revenue)
+    ).filter(
+        SellerDailyStats.seller_id == seller_id,
+        SellerDailyStats.day >= since,
+        SellerDailyStats.status != CANCELLED
+    ).group_by(SellerDailyStats.day).order_by(SellerDailyStats.day)
+
+    top_products = db.session.query(
+        SellerProductStats.product_id, Product.name,
+        SellerProductStats.order_count, SellerProductStats.units, SellerProductStats.revenue
+    ).join(Product, Product.id == SellerProductStats.product_id).filter(
+        SellerProductStats.seller_id == seller_id,
+        SellerProductStats.order_count > 0
+    ).order_by(SellerProductStats.revenue.desc()).limit(top)
+
+    low = db.session.query(Product.id, Product.name, Product.quantity, Product.unit).filter(
+        Product.is_active == True,
+        Product.seller_id == seller_id,
+        Product.quantity <= low_stock
+    ).order_by(Product.quantity, Product.id).limit(20)
+
+    return {
+        'seller_id': seller_id,
+        'totals': totals,
+        'by_status': by_status,
+        'daily_revenue': [
+            {'day': day.isoformat(), 'order_count': count, 'revenue': round(revenue, 2)}
+            for day, count, revenue in daily if count
+        ],
+        'top_products': [
+            {'product_id': product_id, 'name': name, 'order_count': count, 'units': units,
+             'revenue': round(revenue, 2)}
+            for product_id, name, count, units, revenue in top_products
+        ],
+        'low_stock': [
+            {'product_id': product_id, 'name': name, 'quantity': quantity, 'unit': unit}
+            for product_id, name, quantity, unit in low
+        ]
+    }
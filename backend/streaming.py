@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import time
+from flask import request, Response, stream_with_context
+from metrics import record_serialize_seconds
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_BATCH_SIZE = 500  # rows fetched per round trip
+FLUSH_BYTES = 64 * 1024
+
+
+def dump_json(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def wants_stream():
+    return request.args.get('format') == 'ndjson' or request.args.get('stream') in ('1', 'true')
+
+
+# Serializes rows as the query yields them and sends them in ~64KB chunks:
+# NDJSON (one object per line) for ?format=ndjson, otherwise one JSON
+# array. Memory stays at one fetch batch plus one chunk whatever the size
+# of the result. Pass a query with yield_per() so rows aren't loaded at once.
+def stream_json(rows, serialize):
+    ndjson = request.args.get('format') == 'ndjson'
+
+    def generate():
+        buffer = bytearray() if ndjson else bytearray(b'[')
+        first = True
+        spent = 0.0
+        try:
+            for row in rows:
+                start = time.perf_counter()
+                if ndjson:
+                    buffer += dump_json(serialize(row)) + b'\n'
+                else:
+                    if not first:
+                        buffer += b','
+                    buffer += dump_json(serialize(row))
+                    first = False
+                spent += time.perf_counter() - start
+                if len(buffer) >= FLUSH_BYTES:
+                    yield bytes(buffer)
+                    buffer.clear()
+            if not ndjson:
+                buffer += b']'
+            if buffer:
+                yield bytes(buffer)
+        finally:
+            record_serialize_seconds(spent)
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+# CSV counterpart of stream_json: a header row, then `serialize(row)` (a
+# dict) per row under the same columns, sent in the same ~64KB chunks
+def stream_csv(rows, columns, serialize):
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, columns, extrasaction='ignore')
+        writer.writeheader()
+        spent = 0.0
+        try:
+            for row in rows:
+                start = time.perf_counter()
+                writer.writerow(serialize(row))
+                spent += time.perf_counter() - start
+                if buffer.tell() >= FLUSH_BYTES:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        finally:
+            record_serialize_seconds(spent)
+
+    return Response(stream_with_context(generate()), mimetype='text/csv')
@@ -0,0 +1,51 @@
+# Run from backend/: python -m pytest tests
+import os
+import sys
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_temp_database
+
+# Before `import app`, which reads DATABASE_URL at import time
+use_temp_database()
+
+from app import app as flask_app, init_db
+from benchmarks.datagen import generate
+from cache import response_cache
+from models import db
+
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        init_db()
+        generate(farmers=5, buyers=5, products=300, orders=300)
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# (statement, parameters) for every statement the engine runs during the test
+@pytest.fixture
+def statements(app):
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+# Cached responses would run no listing query at all
+def get_uncached(client, url):
+    response_cache.backend.clear()
+    return client.get(url)
@@ -0,0 +1,49 @@
+import pytest
+from models import Order, Product, db
+
+
+def in_stock_product(app):
+    with app.app_context():
+        return db.session.query(Product.id).filter(Product.is_active, Product.quantity > 5).first().id
+
+
+@pytest.mark.parametrize('buyer_id', [[7], 'abc', 0, -3, True, 1.5, None])
+def test_batch_rejects_invalid_buyer(app, client, buyer_id):
+    with app.app_context():
+        orders = db.session.query(Order).count()
+    response = client.post('/api/orders/batch', json={
+        'buyer_id': buyer_id, 'items': [{'product_id': in_stock_product(app), 'quantity': 1}]
+    })
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'buyer_id must be a positive integer'}
+    with app.app_context():
+        assert db.session.query(Order).count() == orders
+
+
+def test_batch_rejects_non_string_notes(app, client):
+    response = client.post('/api/orders/batch', json={
+        'buyer_id': 7, 'items': [{'product_id': in_stock_product(app), 'quantity': 1, 'notes': {'a': 1}}]
+    })
+    assert response.status_code == 400
+    assert response.get_json()['results'][0]['error'] == 'Notes must be a string'
+
+
+def test_order_rejects_non_string_notes(app, client):
+    product_id = in_stock_product(app)
+    with app.app_context():
+        seller_id = db.session.get(Product, product_id).seller_id
+    response = client.post('/api/orders', json={
+        'product_id': product_id, 'seller_id': seller_id, 'buyer_id': 7, 'quantity': 1, 'notes': ['x']
+    })
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Notes must be a string'}
+
+
+def test_batch_stores_numeric_buyer_id(app, client):
+    response = client.post('/api/orders/batch', json={
+        'buyer_id': '7', 'items': [{'product_id': in_stock_product(app), 'quantity': 1, 'notes': None}]
+    })
+    assert response.status_code == 201
+    order_id = response.get_json()['results'][0]['order']['id']
+    with app.app_context():
+        assert db.session.get(Order, order_id).buyer_id == 7
@@ -0,0 +1,41 @@
+import base64
+import json
+
+import pytest
+from conftest import get_uncached
+
+
+def cursor(*fields):
+    return base64.urlsafe_b64encode(json.dumps(list(fields)).encode()).decode().rstrip('=')
+
+
+# A cursor whose sort value doesn't fit the column is a client error, never
+# a 500 or a silently wrong page
+@pytest.mark.parametrize('url', [
+    '/api/products?sort=price&order=asc&limit=5&cursor=' + cursor('price', 'asc', 'x', 3),
+    '/api/products?sort=price&order=asc&limit=5&cursor=' + cursor('price', 'asc', True, 3),
+    '/api/products?sort=price&order=asc&limit=5&cursor=' + cursor('price', 'asc', None, 3),
+    '/api/products?limit=5&cursor=' + cursor('created_at', 'desc', 5, 3),
+    '/api/products?limit=5&cursor=' + cursor('created_at', 'desc', '2026-01-01T00:00:00', '3'),
+    '/api/orders?sort=total_price&limit=5&cursor=' + cursor('total_price', 'desc', [1], 3),
+    '/api/products?limit=5&cursor=not-base64!'
+])
+def test_malformed_cursor_is_rejected(client, url):
+    response = get_uncached(client, url)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+def test_cursor_walk_covers_listing(client):
+    seen = []
+    url = '/api/products?sort=harvest_date&limit=40'
+    response = get_uncached(client, url)
+    while True:
+        assert response.status_code == 200
+        seen += [product['id'] for product in response.get_json()]
+        next_cursor = response.headers.get('X-Next-Cursor')
+        if not next_cursor:
+            break
+        response = get_uncached(client, f'{url}&cursor={next_cursor}')
+    full = get_uncached(client, '/api/products?sort=harvest_date').get_json()
+    assert seen == [product['id'] for product in full]
@@ -0,0 +1,45 @@
+import io
+
+import bulk
+from models import Product, db
+
+HEADER = b'name,price,quantity,category_id,description\n'
+# Rows long enough that the file is decoded in several reads, so rows come
+# out before the reader reaches the bad bytes
+PADDING = b'x' * 3000
+
+
+def post_import(client, body, query=''):
+    return client.post(f'/api/sellers/1/products/import?format=csv{query}', data=body,
+                       content_type='text/csv')
+
+
+def imported_count(app, name):
+    with app.app_context():
+        return db.session.query(Product).filter(Product.name.startswith(name)).count()
+
+
+# Batches committed before the file became unreadable are reported, not
+# hidden behind a 400
+def test_error_after_committed_batches_is_partial_success(app, client, monkeypatch):
+    monkeypatch.setattr(bulk, 'IMPORT_BATCH_SIZE', 2)
+    body = HEADER + b''.join(b'Partial %d,10,5,1,%s\n' % (i, PADDING) for i in range(6)) + b'Broken \xff,10,5,1,\n'
+    response = post_import(client, io.BytesIO(body))
+    assert response.status_code == 207
+    summary = response.get_json()
+    assert summary['error'] == 'CSV must be UTF-8 encoded'
+    assert summary['imported'] == imported_count(app, 'Partial') > 0
+
+
+def test_unreadable_file_without_imports_is_rejected(app, client):
+    response = post_import(client, io.BytesIO(HEADER + b'Nothing \xff,10,5,1,\n'))
+    assert response.status_code == 400
+    assert imported_count(app, 'Nothing') == 0
+
+
+def test_dry_run_with_format_error_is_rejected(app, client, monkeypatch):
+    monkeypatch.setattr(bulk, 'IMPORT_BATCH_SIZE', 2)
+    body = HEADER + b''.join(b'Dry %d,10,5,1,%s\n' % (i, PADDING) for i in range(6)) + b'Broken \xff,10,5,1,\n'
+    response = post_import(client, io.BytesIO(body), '&dry_run=1')
+    assert response.status_code == 400
+    assert imported_count(app, 'Dry') == 0
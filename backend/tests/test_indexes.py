@@ -0,0 +1,47 @@
+import pytest
+from conftest import get_uncached
+from models import db
+
+
+# EXPLAIN QUERY PLAN rows of the statement that fetched the page
+def page_plan(app, statements, table):
+    page = [(statement, parameters) for statement, parameters in statements
+            if f'FROM {table}' in statement and 'ORDER BY' in statement]
+    assert len(page) == 1, page
+    statement, parameters = page[0]
+    with app.app_context():
+        return [row[3] for row in db.session.connection().exec_driver_sql(
+            f'EXPLAIN QUERY PLAN {statement}', parameters
+        )]
+
+
+@pytest.mark.parametrize('url, table, index', [
+    ('/api/products', 'products', 'ix_products_active_created'),
+    ('/api/products?category_id=2', 'products', 'ix_products_active_category_created'),
+    ('/api/products?seller_id=2', 'products', 'ix_products_active_seller_created'),
+    ('/api/products?sort=price&order=asc', 'products', 'ix_products_active_price'),
+    ('/api/products?sort=price&order=desc', 'products', 'ix_products_active_price'),
+    ('/api/products?sort=harvest_date', 'products', 'ix_products_active_harvest'),
+    ('/api/products?sort=harvest_date&order=asc', 'products', 'ix_products_active_harvest'),
+    ('/api/orders', 'orders', 'ix_orders_created'),
+    ('/api/orders?sort=created_at&order=asc', 'orders', 'ix_orders_created'),
+    ('/api/orders?seller_id=2', 'orders', 'ix_orders_seller_created'),
+    ('/api/orders?seller_id=2&status=pending', 'orders', 'ix_orders_seller_status_created'),
+    ('/api/orders?buyer_id=7', 'orders', 'ix_orders_buyer_created'),
+    ('/api/orders?buyer_id=7&status=delivered', 'orders', 'ix_orders_buyer_status_created'),
+    ('/api/orders?status=pending', 'orders', 'ix_orders_status_created')
+])
+def test_listing_uses_index(app, client, statements, url, table, index):
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            pytest.skip('EXPLAIN QUERY PLAN is SQLite syntax')
+    response = get_uncached(client, url)
+    assert response.status_code == 200
+    plan = page_plan(app, statements, table)
+    assert any(f'USING INDEX {index}' in row for row in plan), plan
+    # Unfiltered listings walk their index in order and stop at the limit;
+    # any other scan of the table reads every row
+    scans = [row for row in plan if row.startswith(f'SCAN {table}')]
+    assert all(f'USING INDEX {index}' in row for row in scans), plan
+    # The index must also hand rows over in page order, not just find them
+    assert not any('USE TEMP B-TREE' in row for row in plan), plan
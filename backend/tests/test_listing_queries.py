@@ -0,0 +1,33 @@
+import pytest
+from conftest import get_uncached
+
+LIMITS = (1, 10, 100)
+
+
+# Seller and category names are loaded with the page, so a larger page must
+# not add statements (one per row would be the N+1 this guards against)
+@pytest.mark.parametrize('url', [
+    '/api/products?',
+    '/api/products?category_id=2&',
+    '/api/products?seller_id=2&',
+    '/api/products?sort=price&order=asc&',
+    '/api/products?search=domates&',
+    '/api/products?fields=id,name,seller_name,seller_location,category_name&',
+    '/api/orders?seller_id=2&',
+    '/api/orders?buyer_id=7&fields=id,product_name,seller_name,buyer_name&'
+])
+def test_listing_statement_count_does_not_grow_with_page_size(client, statements, url):
+    counts = {}
+    for limit in LIMITS:
+        statements.clear()
+        response = get_uncached(client, f'{url}limit={limit}')
+        assert response.status_code == 200
+        counts[limit] = len(statements)
+    assert len(set(counts.values())) == 1, counts
+
+
+def test_product_listing_runs_version_and_page_queries_only(client, statements):
+    response = get_uncached(client, f'/api/products?limit={LIMITS[-1]}')
+    assert len(response.get_json()) == LIMITS[-1]
+    assert all(product['seller_name'] for product in response.get_json())
+    assert len(statements) == 2
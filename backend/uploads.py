@@ -0,0 +1,49 @@
+import mimetypes
+import os
+from flask import request, Response
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+from images import HASHED_NAME_RE, VARIANT_NAME_RE
+
+# '' streams from Python (through gunicorn's sendfile-backed file wrapper),
+# 'x-accel' hands the file to nginx, 'x-sendfile' to Apache/lighttpd. For
+# nginx, map the prefix to the upload folder:
+#   location /protected-uploads/ { internal; alias /app/backend/uploads/; }
+UPLOAD_SENDFILE_MODE = os.getenv('UPLOAD_SENDFILE_MODE', '')
+UPLOAD_ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+
+# Content-addressed names never change content, so clients can keep them
+# forever; legacy timestamp names get a day
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+LEGACY_CACHE = 'public, max-age=86400'
+
+
+def cache_policy(filename):
+    if HASHED_NAME_RE.match(filename) or VARIANT_NAME_RE.match(filename):
+        return IMMUTABLE_CACHE
+    return LEGACY_CACHE
+
+
+# Serves a file from the upload folder with ETag/Last-Modified validation
+# and Range support, or delegates the bytes to the front proxy. Returns None
+# when the file does not exist.
+def send_upload(folder, filename, cache_control):
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+
+    if UPLOAD_SENDFILE_MODE == 'x-accel':
+        # nginx adds ETag, Last-Modified and Range handling itself
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX + filename
+    else:
+        # Content-addressed names carry their own strong validator, which
+        # stays the same across servers (the default is mtime based)
+        match = HASHED_NAME_RE.match(filename) or VARIANT_NAME_RE.match(filename)
+        response = send_file(
+            path, request.environ,
+            conditional=True, etag=filename if match else True,
+            use_x_sendfile=UPLOAD_SENDFILE_MODE == 'x-sendfile'
+        )
+    response.headers['Cache-Control'] = cache_control
+    return response